@@ -0,0 +1,87 @@
+import importlib
+import logging
+
+from .references import resolve_function
+
+logger = logging.getLogger('backends')
+
+# Plotting backends, by name, and the module each one imports.
+_backends = {
+    'plotly': 'plotly.graph_objs',
+}
+
+# Viewer classes, by kind of viewer and backend, as 'module:qualname' references.
+_viewers = {
+    ('nd', 'plotly'): 'vizapp.viewers.viewernd:PlotlyViewerND',
+    ('1d', 'plotly'): 'vizapp.viewers.viewer1d:PlotlyViewer1D',
+    ('3d', 'plotly'): 'vizapp.viewers.viewer3d:PlotlyViewer3D',
+}
+
+# Modules of the backends imported so far.
+_loaded = {}
+
+
+def register_backend(name, module):
+    """
+    Add, or replace, a plotting backend. Nothing is imported until the
+    backend is loaded.
+
+    :param name: str - name of the backend
+    :param module: str - module to import when the backend is loaded
+    :return: none
+    """
+    if name in _backends:
+        logger.warning('Replacing backend {}'.format(name))
+
+    _backends[name] = module
+    _loaded.pop(name, None)
+
+
+def load_backend(name):
+    """
+    Import a plotting backend, the first time it is needed.
+
+    :param name: str - name of the backend
+    :return: module
+    """
+    if name not in _loaded:
+        if name not in _backends:
+            raise KeyError('load_backend: unknown backend {}, available are {}'.format(name, sorted(_backends)))
+
+        try:
+            _loaded[name] = importlib.import_module(_backends[name])
+        except ImportError as e:
+            raise ImportError('load_backend: backend {} is not available: {}'.format(name, e)) from e
+
+        logger.debug('Loaded backend {} from {}'.format(name, _backends[name]))
+
+    return _loaded[name]
+
+
+def register_viewer(kind, backend, reference):
+    """
+    Add, or replace, the viewer of a kind of data for a backend.
+
+    :param kind: str - kind of viewer, e.g. 'nd', '1d' or '3d'
+    :param backend: str - name of the backend
+    :param reference: str - 'module:qualname' of the viewer class
+    :return: none
+    """
+    if not isinstance(reference, str) or reference.count(':') != 1:
+        raise ValueError('register_viewer: reference must be a "module:qualname" string, got {}'.format(reference))
+
+    _viewers[(kind, backend)] = reference
+
+
+def get_viewer(kind, backend='plotly'):
+    """
+    Import the viewer class of a kind of data for a backend.
+
+    :param kind: str - kind of viewer, e.g. 'nd', '1d' or '3d'
+    :param backend: str - name of the backend
+    :return: class
+    """
+    if (kind, backend) not in _viewers:
+        raise KeyError('get_viewer: no {} viewer for backend {}'.format(kind, backend))
+
+    return resolve_function(_viewers[(kind, backend)])
@@ -0,0 +1,198 @@
+import collections
+import logging
+import threading
+import warnings
+
+import numpy as np
+
+logger = logging.getLogger('bricks')
+
+
+class BrickPyramid:
+    """
+    Multi-resolution, bricked representation of a 3D dataset for volume
+    rendering.
+
+    Level 0 is the data itself. Each coarser level halves the axes that are
+    longer than half of the longest one (so a 4563x74x74 cube is first
+    reduced along the spectral axis only) by averaging blocks of voxels,
+    ignoring NaNs. Every level is split into bricks, which are built or read
+    from the data only when a region that overlaps them is requested, and
+    are cached. Coarse levels give an overview of the whole cube, full
+    resolution bricks are only read where the view zooms in.
+    """
+
+    def __init__(self, data, brick_shape=(64, 32, 32), cache_voxels=32 * 1024 * 1024):
+        """
+
+        :param data: 3D array-like
+        :param brick_shape: tuple - shape of the bricks of every level
+        :param cache_voxels: int - maximum number of voxels of bricks to keep
+        """
+        if len(data.shape) != 3:
+            raise ValueError('BrickPyramid: data must be 3D, got shape {}'.format(data.shape))
+
+        self._data = data
+        self._shape = tuple(data.shape)
+        self._brick_shape = tuple(brick_shape)
+        self._cache_voxels = cache_voxels
+        self._cache = collections.OrderedDict()
+        self._cached_voxels = 0
+        self._lock = threading.RLock()
+
+        # Factor of each level relative to level 0, per axis.
+        shape = np.array(data.shape)
+        factors = [np.ones(3, dtype=int)]
+        while (shape > 1).any():
+            halve = (shape > 1) & (shape * 2 > shape.max())
+            factors.append(factors[-1] * np.where(halve, 2, 1))
+            shape = -(-shape // np.where(halve, 2, 1))
+        self._factors = [tuple(int(x) for x in f) for f in factors]
+
+    @property
+    def nlevels(self):
+        return len(self._factors)
+
+    @property
+    def data(self):
+        return self._data
+
+    @property
+    def shape(self):
+        return self._shape
+
+    def factors(self, level):
+        """
+        :param level: int - pyramid level
+        :return: tuple - size, in level 0 voxels, of a voxel of this level
+        """
+        return self._factors[level]
+
+    def level_shape(self, level):
+        """
+        :param level: int - pyramid level
+        :return: tuple - shape of the whole cube at this level
+        """
+        return tuple(-(-n // f) for n, f in zip(self.shape, self._factors[level]))
+
+    # ---------------------------------------------------------------
+    #
+    #  level of detail
+    #
+    # ---------------------------------------------------------------
+
+    def _level_bounds(self, level, bounds):
+        # Level 0 (start, stop) bounds to the voxels of a level that cover them.
+        return [(start // f, -(-stop // f)) for (start, stop), f in zip(bounds, self._factors[level])]
+
+    def voxels(self, level, bounds=None):
+        """
+        Number of voxels of a level needed to cover a region.
+
+        :param level: int - pyramid level
+        :param bounds: tuple - ((z0, z1), (y0, y1), (x0, x1)) in level 0 voxels,
+                       the whole cube by default
+        :return: int
+        """
+        bounds = bounds or tuple((0, n) for n in self.shape)
+        return int(np.prod([stop - start for start, stop in self._level_bounds(level, bounds)]))
+
+    def choose_level(self, bounds=None, max_voxels=100000):
+        """
+        Finest level that covers a region in at most max_voxels voxels.
+
+        :param bounds: tuple - ((z0, z1), (y0, y1), (x0, x1)) in level 0 voxels
+        :param max_voxels: int - voxel budget of the view
+        :return: int
+        """
+        for level in range(self.nlevels):
+            if self.voxels(level, bounds) <= max_voxels:
+                return level
+        return self.nlevels - 1
+
+    # ---------------------------------------------------------------
+    #
+    #  bricks
+    #
+    # ---------------------------------------------------------------
+
+    def _brick(self, level, index):
+        key = (level, index)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        shape = self.level_shape(level)
+        bounds = [(i * b, min((i + 1) * b, n)) for i, b, n in zip(index, self._brick_shape, shape)]
+
+        if level == 0:
+            brick = np.asarray(self._data[tuple(slice(start, stop) for start, stop in bounds)], dtype=float)
+        else:
+            # Average blocks of the level above.
+            step = [f // p for f, p in zip(self._factors[level], self._factors[level - 1])]
+            parent_shape = self.level_shape(level - 1)
+            source = self._level_region(level - 1, [(start * s, min(stop * s, n))
+                                                    for (start, stop), s, n in zip(bounds, step, parent_shape)])
+            brick = _downsample(source, step)
+
+        with self._lock:
+            self._cache[key] = brick
+            self._cached_voxels += brick.size
+            while self._cached_voxels > self._cache_voxels and len(self._cache) > 1:
+                self._cached_voxels -= self._cache.popitem(last=False)[1].size
+
+        return brick
+
+    def _level_region(self, level, bounds):
+        # Assemble the region of a level (in that level's voxels) from bricks.
+        ranges = [range(start // b, -(-stop // b)) for (start, stop), b in zip(bounds, self._brick_shape)]
+        out = np.empty([stop - start for start, stop in bounds])
+
+        for iz in ranges[0]:
+            for iy in ranges[1]:
+                for ix in ranges[2]:
+                    index = (iz, iy, ix)
+                    brick = self._brick(level, index)
+
+                    target, source = [], []
+                    for i, b, (start, stop), n in zip(index, self._brick_shape, bounds, brick.shape):
+                        lo, hi = max(i * b, start), min(i * b + n, stop)
+                        target.append(slice(lo - start, hi - start))
+                        source.append(slice(lo - i * b, hi - i * b))
+                    out[tuple(target)] = brick[tuple(source)]
+
+        return out
+
+    def region(self, level, bounds=None):
+        """
+        Get the voxels of a level that cover a region, and their positions.
+
+        :param level: int - pyramid level
+        :param bounds: tuple - ((z0, z1), (y0, y1), (x0, x1)) in level 0 voxels,
+                       the whole cube by default
+        :return: tuple - (3D numpy array, list of the level 0 coordinates of
+                 the voxel centers along each axis)
+        """
+        bounds = bounds or tuple((0, n) for n in self.shape)
+        level_bounds = self._level_bounds(level, bounds)
+
+        data = self._level_region(level, level_bounds)
+        centers = [np.arange(start, stop) * f + (f - 1) / 2
+                   for (start, stop), f in zip(level_bounds, self._factors[level])]
+
+        return data, centers
+
+
+def _downsample(data, step):
+    """
+    Average blocks of step voxels, ignoring NaNs. Edge blocks may be partial.
+    """
+    shape = [-(-n // s) for n, s in zip(data.shape, step)]
+    padded = np.full([n * s for n, s in zip(shape, step)], np.nan)
+    padded[tuple(slice(0, n) for n in data.shape)] = data
+
+    blocks = padded.reshape(shape[0], step[0], shape[1], step[1], shape[2], step[2])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.nanmean(blocks, axis=(1, 3, 5))
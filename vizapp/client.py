@@ -0,0 +1,188 @@
+import collections
+import json
+import logging
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import numpy as np
+
+from .server import decode_array
+from .vizapp import VizApp
+
+logger = logging.getLogger('client')
+
+
+class _Connection:
+    """
+    Fetches from a VizAppServer, keeping the most recent responses and
+    revalidating them with their ETag, so unchanged data is not sent again.
+    """
+
+    def __init__(self, url, cache_size=256):
+        self._url = url.rstrip('/')
+        self._cache = collections.OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    def get(self, path, **query):
+        url = self._url + path
+        if query:
+            url += '?' + urllib.parse.urlencode(query)
+
+        request = urllib.request.Request(url)
+        with self._lock:
+            cached = self._cache.get(url)
+        if cached is not None:
+            request.add_header('If-None-Match', cached[0])
+
+        try:
+            with urllib.request.urlopen(request) as response:
+                payload, headers = response.read(), response.headers
+        except urllib.error.HTTPError as e:
+            if e.code == 304 and cached is not None:
+                logger.debug('Not modified: {}'.format(url))
+                with self._lock:
+                    self._cache.move_to_end(url)
+                return cached[1]
+            raise
+
+        if headers.get_content_type() == 'application/json':
+            value = json.loads(payload.decode())
+        else:
+            value = decode_array(payload, headers)
+
+        if 'ETag' in headers:
+            with self._lock:
+                self._cache[url] = (headers['ETag'], value)
+                if len(self._cache) > self._cache_size:
+                    self._cache.popitem(last=False)
+
+        return value
+
+
+def _quote(name):
+    return urllib.parse.quote(name, safe='')
+
+
+class RemoteArray:
+    """
+    Read-only array served by a VizAppServer. Slices, tiles, regions (e.g.
+    the bricks of a BrickPyramid) and spectra are fetched with their own
+    requests, anything else fetches the whole dataset.
+    """
+
+    def __init__(self, connection, name, shape, dtype):
+        self._connection = connection
+        self._name = name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return '<RemoteArray {} shape={} dtype={}>'.format(self._name, self.shape, self.dtype)
+
+    def _path(self, *parts):
+        return '/'.join(('/datasets', _quote(self._name)) + tuple(str(x) for x in parts))
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+
+        if self.ndim == 3 and key and isinstance(key[0], (int, np.integer)):
+            index = int(key[0]) + self.shape[0] if key[0] < 0 else int(key[0])
+            if not 0 <= index < self.shape[0]:
+                raise IndexError('index {} is out of bounds for axis 0 with size {}'.format(key[0], self.shape[0]))
+
+            rest = key[1:]
+            if len(rest) == 2 and all(isinstance(x, slice) and x.step in (None, 1) for x in rest):
+                window = [x.indices(n) for x, n in zip(rest, self.shape[1:])]
+                tile = self._connection.get(self._path('tile', index), y0=window[0][0], y1=window[0][1],
+                                            x0=window[1][0], x1=window[1][1])
+                return tile
+
+            return self._connection.get(self._path('slice', index))[rest]
+
+        if self.ndim == 3 and len(key) == 3 and all(isinstance(x, slice) and x.step in (None, 1) for x in key):
+            window = [x.indices(n) for x, n in zip(key, self.shape)]
+            return self._connection.get(self._path('region'), z0=window[0][0], z1=window[0][1],
+                                        y0=window[1][0], y1=window[1][1], x0=window[2][0], x1=window[2][1])
+
+        if (self.ndim == 3 and len(key) == 3 and key[0] == slice(None) and
+                all(isinstance(x, (int, np.integer)) and 0 <= x < n for x, n in zip(key[1:], self.shape[1:]))):
+            return self._connection.get(self._path('spectrum', int(key[1]), int(key[2])))
+
+        return np.asarray(self)[key]
+
+    def __array__(self, dtype=None):
+        data = self._connection.get(self._path('data'))
+        return np.asarray(data, dtype=dtype)
+
+
+class RemoteStatistics:
+    """
+    Colour limits of a dataset served by a VizAppServer, computed and cached
+    on the server.
+    """
+
+    def __init__(self, connection, name):
+        self._connection = connection
+        self._name = name
+
+    @property
+    def done(self):
+        # Nothing is computed locally, so there is nothing to save or copy.
+        return False
+
+    def limits(self, index=None, percentile=None):
+        """
+        :param index: int - slice number, None for the global limits
+        :param percentile: float - lower percentile to clip at, None or 0 for min/max
+        :return: tuple - (low, high)
+        """
+        path = '/datasets/{}/limits'.format(_quote(self._name))
+        if index is not None:
+            path += '/{}'.format(int(index))
+
+        if percentile:
+            return tuple(self._connection.get(path, percentile=percentile))
+        return tuple(self._connection.get(path))
+
+
+class RemoteVizApp(VizApp):
+    """
+    VizApp whose datasets are served by a VizAppServer, e.g. one running in
+    another kernel. Viewers can use it as they use a VizApp, while only the
+    slices and spectra they show are transferred. Processing runs locally
+    and its results are added locally.
+    """
+
+    def __init__(self, url):
+        """
+
+        :param url: str - URL of the VizAppServer, e.g. VizAppServer.url
+        """
+        super().__init__()
+
+        self._connection = _Connection(url)
+
+        self.refresh()
+
+    def refresh(self):
+        """
+        Update the list of datasets from the server.
+
+        :return: none
+        """
+        for info in self._connection.get('/datasets'):
+            if len(info['shape']) in (1, 2, 3):
+                data = RemoteArray(self._connection, info['name'], info['shape'], info['dtype'])
+                statistics = RemoteStatistics(self._connection, info['name']) if data.ndim == 3 else None
+                self._register_data(info['name'], data, statistics=statistics)
@@ -0,0 +1,154 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger('kernels')
+
+EDGE_MODES = ('zeros', 'nearest', 'reflect', 'nan')
+
+
+def _pad(a, before, after, edge):
+    """
+    Pad the last axis of a according to the edge mode.
+    """
+    if edge not in EDGE_MODES:
+        raise ValueError('edge must be one of {}, got {}'.format(EDGE_MODES, edge))
+
+    width = [(0, 0)] * (a.ndim - 1) + [(before, after)]
+
+    if edge == 'zeros':
+        return np.pad(a, width, mode='constant', constant_values=0)
+    if edge == 'nan':
+        return np.pad(a, width, mode='constant', constant_values=np.nan)
+    if edge == 'nearest':
+        return np.pad(a, width, mode='edge')
+    return np.pad(a, width, mode='reflect')
+
+
+# Number of window values to sort at once, bounds the memory used by running_median.
+_MEDIAN_BLOCK = 1024 * 1024
+
+
+def running_median(volume, kernel_size=3, axis=-1, edge='zeros'):
+    """
+    Running median along one axis of an array of any dimension.
+
+    The windows are strided views of the padded data, sorted in blocks of
+    lanes so that the temporary copies stay small. This is O(n k log k) per
+    lane but fully vectorized, which for the kernel sizes used here is
+    faster than maintaining a sorted window sample by sample.
+
+    NaNs are ignored: the median is over the valid values in each window
+    and is NaN only when the whole window is NaN. With the default 'zeros'
+    edge mode the result on finite 1D input is identical to
+    scipy.signal.medfilt.
+
+    :param volume: numpy array of data
+    :param kernel_size: int - odd size of the median window
+    :param axis: int - axis along which to filter
+    :param edge: str - how to pad the edges: 'zeros' (as medfilt),
+                 'nearest', 'reflect' or 'nan' (window shrinks at the edges)
+    :return: numpy array of the same shape as volume
+    """
+    if kernel_size < 1 or kernel_size % 2 == 0:
+        raise ValueError('running_median: kernel_size, {}, must be odd and positive'.format(kernel_size))
+
+    data = np.moveaxis(np.asarray(volume, dtype=float), axis, -1)
+    shape = data.shape
+    n = shape[-1]
+
+    half = kernel_size // 2
+    lanes = data.reshape(int(np.prod(shape[:-1])), n)
+    out = np.empty(lanes.shape)
+    if not n:
+        return np.moveaxis(out.reshape(shape), -1, axis)
+
+    block = max(1, _MEDIAN_BLOCK // max(1, n * kernel_size))
+    for start in range(0, len(lanes), block):
+        padded = _pad(lanes[start:start + block], half, half, edge)
+        missing = np.isnan(padded)
+
+        windows = np.lib.stride_tricks.sliding_window_view(padded, kernel_size, axis=-1)
+        if not missing.any():
+            out[start:start + block] = np.median(windows, axis=-1)
+            continue
+
+        # NaNs sort last, as +inf would, so the valid values of each window
+        # come first and the median is taken over those only.
+        ordered = np.sort(np.where(np.isnan(windows), np.inf, windows), axis=-1)
+        nvalid = kernel_size - np.lib.stride_tricks.sliding_window_view(missing, kernel_size, axis=-1).sum(axis=-1)
+
+        lower = np.take_along_axis(ordered, np.maximum((nvalid - 1) // 2, 0)[..., np.newaxis], axis=-1)[..., 0]
+        upper = np.take_along_axis(ordered, np.minimum(nvalid // 2, kernel_size - 1)[..., np.newaxis], axis=-1)[..., 0]
+        with np.errstate(invalid='ignore'):
+            out[start:start + block] = np.where(nvalid > 0, 0.5 * (lower + upper), np.nan)
+
+    return np.moveaxis(out.reshape(shape), -1, axis)
+
+
+def convolve(a, w, mode='full', axis=-1, edge='zeros', nan_policy='propagate'):
+    """
+    Convolve every lane along one axis of an array with the kernel w.
+
+    The convolution is done for all lanes at once as one weighted sum of
+    shifted copies per kernel element. On 1D input with the default options
+    the result is np.convolve(a, w, mode) up to rounding, as the products
+    are summed in a different order (differences of a few 1e-16 relative).
+
+    :param a: numpy array of data
+    :param w: 1D numpy array - the convolution kernel
+    :param mode: str - 'full', 'same' or 'valid' as in np.convolve
+    :param axis: int - axis along which to convolve
+    :param edge: str - how to pad the data for 'full' and 'same': 'zeros'
+                 (as np.convolve), 'nearest', 'reflect' or 'nan'
+    :param nan_policy: str - 'propagate' (as np.convolve) or 'ignore' to
+                       leave NaNs out and renormalize the kernel weights
+    :return: numpy array
+    """
+    if mode not in ('full', 'same', 'valid'):
+        raise ValueError('convolve: mode must be full, same or valid, got {}'.format(mode))
+
+    if nan_policy not in ('propagate', 'ignore'):
+        raise ValueError('convolve: nan_policy must be propagate or ignore, got {}'.format(nan_policy))
+
+    w = np.asarray(w, dtype=float)
+    if w.ndim != 1 or not len(w):
+        raise ValueError('convolve: w must be a non-empty 1D array')
+
+    data = np.moveaxis(np.asarray(a, dtype=float), axis, -1)
+    n, k = data.shape[-1], len(w)
+    if not n:
+        raise ValueError('convolve: a can not be empty along axis {}'.format(axis))
+
+    padded = _pad(data, k - 1, k - 1, edge)
+
+    if nan_policy == 'ignore':
+        valid = ~np.isnan(padded)
+        values = _slide(np.where(valid, padded, 0), w)
+        weights = _slide(valid.astype(float), w)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            full = np.where(weights != 0, values / weights * w.sum(), np.nan)
+    else:
+        full = _slide(padded, w)
+
+    # Same output ranges as np.convolve, which swaps its inputs when the
+    # kernel is the longer of the two.
+    if mode == 'valid':
+        start, length = min(n, k) - 1, max(n, k) - min(n, k) + 1
+    elif mode == 'same':
+        start, length = (min(n, k) - 1) // 2, max(n, k)
+    else:
+        start, length = 0, n + k - 1
+
+    return np.moveaxis(full[..., start:start + length], -1, axis)
+
+
+def _slide(padded, w):
+    # Full convolution of data that was padded by len(w) - 1 on both sides.
+    length = padded.shape[-1] - len(w) + 1
+
+    full = np.zeros(padded.shape[:-1] + (length,))
+    for ii, weight in enumerate(w[::-1]):
+        full += weight * padded[..., ii:ii + length]
+
+    return full
@@ -0,0 +1,32 @@
+import importlib
+
+
+def function_reference(func):
+    """
+    The 'module:qualname' string that resolve_function() turns back into func.
+
+    :param func: function, or a reference that was not resolved yet
+    :return: str, or None for functions that can not be imported by name
+             (lambdas, nested functions)
+    """
+    if isinstance(func, str):
+        # Registered by reference and not loaded yet.
+        return func
+    module, qualname = getattr(func, '__module__', None), getattr(func, '__qualname__', '')
+    if module is None or '<' in qualname:
+        return None
+    return '{}:{}'.format(module, qualname)
+
+
+def resolve_function(reference):
+    """
+    Import the function referenced by a 'module:qualname' string.
+
+    :param reference: str - function reference
+    :return: function
+    """
+    module_name, qualname = reference.split(':')
+    obj = importlib.import_module(module_name)
+    for attribute in qualname.split('.'):
+        obj = getattr(obj, attribute)
+    return obj
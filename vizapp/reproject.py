@@ -0,0 +1,187 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger('reproject')
+
+
+class Grid:
+    """
+    Spatial pixel grid of a 2D image or of the slices of a 3D cube.
+
+    Pixel (y, x) is at world position origin + R(rotation) * (scale * (y, x)),
+    where the rotation is counter-clockwise in degrees. The default grid is
+    the pixel grid itself.
+    """
+
+    def __init__(self, shape, origin=(0.0, 0.0), scale=(1.0, 1.0), rotation=0.0):
+        """
+
+        :param shape: tuple - (ny, nx) number of pixels
+        :param origin: tuple - (y, x) world position of pixel (0, 0)
+        :param scale: tuple - (y, x) world size of a pixel
+        :param rotation: float - rotation of the grid in degrees
+        """
+        self.shape = tuple(int(x) for x in shape[-2:])
+        self.origin = tuple(float(x) for x in origin)
+        self.scale = tuple(float(x) for x in scale)
+        self.rotation = float(rotation)
+
+    @property
+    def signature(self):
+        """
+        Hashable description of the grid, equal for equal grids.
+        """
+        return (self.shape, self.origin, self.scale, self.rotation)
+
+    def __eq__(self, other):
+        return isinstance(other, Grid) and self.signature == other.signature
+
+    def __hash__(self):
+        return hash(self.signature)
+
+    def __repr__(self):
+        return '<Grid shape={} origin={} scale={} rotation={}>'.format(
+            self.shape, self.origin, self.scale, self.rotation)
+
+    def to_dict(self):
+        return {'shape': list(self.shape), 'origin': list(self.origin),
+                'scale': list(self.scale), 'rotation': self.rotation}
+
+    @classmethod
+    def from_dict(cls, info):
+        return cls(info['shape'], info['origin'], info['scale'], info['rotation'])
+
+    def pixel_to_world(self, y, x):
+        """
+        :param y: numpy array - y pixel coordinates
+        :param x: numpy array - x pixel coordinates
+        :return: tuple - (y, x) world coordinates
+        """
+        angle = np.deg2rad(self.rotation)
+        v, u = np.asarray(y) * self.scale[0], np.asarray(x) * self.scale[1]
+        return (self.origin[0] + np.sin(angle) * u + np.cos(angle) * v,
+                self.origin[1] + np.cos(angle) * u - np.sin(angle) * v)
+
+    def world_to_pixel(self, y, x):
+        """
+        :param y: numpy array - y world coordinates
+        :param x: numpy array - x world coordinates
+        :return: tuple - (y, x) pixel coordinates
+        """
+        angle = np.deg2rad(self.rotation)
+        dy, dx = np.asarray(y) - self.origin[0], np.asarray(x) - self.origin[1]
+        return ((np.cos(angle) * dy - np.sin(angle) * dx) / self.scale[0],
+                (np.sin(angle) * dy + np.cos(angle) * dx) / self.scale[1])
+
+
+class ResamplingOperator:
+    """
+    Bilinear resampling from one grid onto another, as a sparse matrix.
+
+    The matrix has one row per target pixel and one column per source pixel,
+    so resampling an image is one sparse matrix-vector product and resampling
+    all the slices of a cube is one sparse matrix-matrix product. Target
+    pixels outside of the source footprint are NaN, and NaNs in the data are
+    left out by renormalizing the weights of their neighbours.
+    """
+
+    def __init__(self, source, target):
+        """
+
+        :param source: Grid - grid of the data to resample
+        :param target: Grid - grid to resample onto
+        """
+        self.source = source
+        self.target = target
+
+        logger.debug('Building resampling operator from {} to {}'.format(source, target))
+        self._matrix = self._build()
+        self._weights = np.asarray(self._matrix.sum(axis=1)).ravel()
+
+    @property
+    def matrix(self):
+        return self._matrix
+
+    def _build(self):
+        ny, nx = self.source.shape
+        ty, tx = np.indices(self.target.shape)
+        sy, sx = self.source.world_to_pixel(*self.target.pixel_to_world(ty.ravel(), tx.ravel()))
+
+        # Only target pixels that fall within the source pixels get a value.
+        inside = (sy >= -0.5) & (sy <= ny - 0.5) & (sx >= -0.5) & (sx <= nx - 0.5)
+
+        y0, x0 = np.floor(sy).astype(np.intp), np.floor(sx).astype(np.intp)
+        fy, fx = sy - y0, sx - x0
+        rows = np.arange(len(sy))
+
+        all_rows, all_columns, all_weights = [], [], []
+        for dy, dx, weight in ((0, 0, (1 - fy) * (1 - fx)), (0, 1, (1 - fy) * fx),
+                               (1, 0, fy * (1 - fx)), (1, 1, fy * fx)):
+            yy, xx = y0 + dy, x0 + dx
+            keep = inside & (weight > 0) & (yy >= 0) & (yy < ny) & (xx >= 0) & (xx < nx)
+            all_rows.append(rows[keep])
+            all_columns.append(yy[keep] * nx + xx[keep])
+            all_weights.append(weight[keep])
+
+        # Imported here, it is only needed once overlays are resampled.
+        import scipy.sparse
+
+        return scipy.sparse.csr_matrix(
+            (np.concatenate(all_weights), (np.concatenate(all_rows), np.concatenate(all_columns))),
+            shape=(len(sy), ny * nx))
+
+    def apply(self, data):
+        """
+        Resample an image, or every slice of a cube, onto the target grid.
+
+        :param data: numpy array of shape source.shape or (n,) + source.shape
+        :return: numpy array of shape target.shape or (n,) + target.shape
+        """
+        data = np.asarray(data, dtype=float)
+        if data.shape[-2:] != self.source.shape:
+            raise ValueError('apply: data of shape {} is not on the source grid {}'.format(
+                data.shape, self.source.shape))
+
+        # One column per slice
+        columns = data.reshape(-1, self.source.shape[0] * self.source.shape[1]).T
+
+        valid = ~np.isnan(columns)
+        if valid.all():
+            weights = self._weights[:, np.newaxis]
+            values = self._matrix @ columns
+        else:
+            weights = self._matrix @ valid.astype(float)
+            values = self._matrix @ np.where(valid, columns, 0)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            resampled = np.where(weights > 0, values / weights, np.nan)
+
+        return resampled.T.reshape(data.shape[:-2] + self.target.shape)
+
+
+class ResamplingCache:
+    """
+    Resampling operators cached by the signatures of their grids, so each is
+    only built once per pair of grids.
+    """
+
+    def __init__(self):
+        self._operators = {}
+
+    def __len__(self):
+        return len(self._operators)
+
+    def get(self, source, target):
+        """
+        :param source: Grid - grid of the data to resample
+        :param target: Grid - grid to resample onto
+        :return: ResamplingOperator
+        """
+        key = (source.signature, target.signature)
+        if key not in self._operators:
+            self._operators[key] = ResamplingOperator(source, target)
+        return self._operators[key]
+
+    def clear(self):
+        self._operators.clear()
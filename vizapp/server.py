@@ -0,0 +1,267 @@
+import hashlib
+import http.server
+import json
+import logging
+import re
+import threading
+import urllib.parse
+
+import numpy as np
+
+logger = logging.getLogger('server')
+
+
+def encode_array(data):
+    """
+    Binary payload of an array: the raw bytes, with the shape and dtype
+    sent as headers.
+
+    :param data: numpy array
+    :return: tuple - (bytes, dict of headers)
+    """
+    data = np.ascontiguousarray(data)
+    headers = {
+        'Content-Type': 'application/octet-stream',
+        'X-Shape': ','.join(str(x) for x in data.shape),
+        'X-Dtype': data.dtype.str
+    }
+    return data.tobytes(), headers
+
+
+def decode_array(payload, headers):
+    """
+    Inverse of encode_array.
+
+    :param payload: bytes
+    :param headers: mapping of the response headers
+    :return: numpy array
+    """
+    shape = tuple(int(x) for x in headers['X-Shape'].split(',') if x)
+    return np.frombuffer(payload, dtype=headers['X-Dtype']).reshape(shape)
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """
+    Serves the datasets of the VizApp of the server:
+
+        /datasets                                  names, shapes and dtypes
+        /datasets/<name>                           shape and dtype of one
+        /datasets/<name>/data                      the whole dataset
+        /datasets/<name>/slice/<i>                 slice i of a 3D dataset
+        /datasets/<name>/tile/<i>?y0=&y1=&x0=&x1=  part of slice i
+        /datasets/<name>/tile?y0=&y1=&x0=&x1=      part of a 2D dataset
+        /datasets/<name>/region?z0=&z1=&y0=&y1=&x0=&x1=
+                                                   part of a 3D dataset
+        /datasets/<name>/spectrum/<y>/<x>          spectrum at a pixel
+        /datasets/<name>/limits/<i>?percentile=    colour limits of slice i
+        /datasets/<name>/limits?percentile=        colour limits of a 3D dataset
+
+    Arrays are sent as raw bytes (see encode_array), everything else as JSON.
+    Every response has an ETag so clients can revalidate what they cached.
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    routes = [
+        (re.compile(r'^/datasets$'), '_datasets'),
+        (re.compile(r'^/datasets/(?P<name>[^/]+)$'), '_info'),
+        (re.compile(r'^/datasets/(?P<name>[^/]+)/data$'), '_data'),
+        (re.compile(r'^/datasets/(?P<name>[^/]+)/slice/(?P<index>-?\d+)$'), '_slice'),
+        (re.compile(r'^/datasets/(?P<name>[^/]+)/tile(?:/(?P<index>-?\d+))?$'), '_tile'),
+        (re.compile(r'^/datasets/(?P<name>[^/]+)/region$'), '_region'),
+        (re.compile(r'^/datasets/(?P<name>[^/]+)/spectrum/(?P<y>\d+)/(?P<x>\d+)$'), '_spectrum'),
+        (re.compile(r'^/datasets/(?P<name>[^/]+)/limits(?:/(?P<index>\d+))?$'), '_limits'),
+    ]
+
+    @property
+    def vizapp(self):
+        return self.server.vizapp
+
+    def log_message(self, format, *args):
+        logger.debug('%s - ' + format, self.address_string(), *args)
+
+    def do_GET(self):
+        url = urllib.parse.urlsplit(self.path)
+        query = {k: v[-1] for k, v in urllib.parse.parse_qs(url.query).items()}
+
+        for pattern, method in self.routes:
+            match = pattern.match(url.path)
+            if match is None:
+                continue
+
+            arguments = {k: urllib.parse.unquote(v) for k, v in match.groupdict().items() if v is not None}
+            name = arguments.get('name')
+
+            # The datasets may change while the request is handled, e.g. a
+            # dataset removed after it was looked up, so errors are answered
+            # rather than dropping the connection.
+            try:
+                if name is not None and self.vizapp.get_data(name) is None:
+                    return self._send_error(404, 'No dataset {}'.format(name))
+
+                etag = self._etag(name)
+                if etag in [x.strip() for x in self.headers.get('If-None-Match', '').split(',')]:
+                    return self._send(304, b'', {'ETag': etag})
+
+                payload, headers = getattr(self, method)(query=query, **arguments)
+            except (IndexError, KeyError, ValueError, TypeError) as e:
+                return self._send_error(400, str(e))
+            except Exception as e:
+                logger.exception('Error handling {}'.format(self.path))
+                return self._send_error(500, str(e))
+
+            headers['ETag'] = etag
+            return self._send(200, payload, headers)
+
+        self._send_error(404, 'Not found: {}'.format(url.path))
+
+    def _send(self, code, payload, headers):
+        self.send_response(code)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        if payload:
+            self.wfile.write(payload)
+
+    def _send_error(self, code, message):
+        payload = json.dumps({'error': message}).encode()
+        self._send(code, payload, {'Content-Type': 'application/json'})
+
+    def _json(self, value):
+        return json.dumps(value).encode(), {'Content-Type': 'application/json'}
+
+    def _etag(self, name):
+        """
+        The response to a request depends only on the request and on the
+        versions and shapes of the datasets it reads. Versions are only
+        unique within a VizApp, so its token is part of the tag too.
+        """
+        state = [self.vizapp._token, self.path]
+        names = [name] if name is not None else sorted(self.vizapp._3d_data) + sorted(self.vizapp._2d_data) + \
+            sorted(self.vizapp._1d_data)
+        while names:
+            current = names.pop()
+            if self.vizapp.get_data(current) is None:
+                raise KeyError('No dataset {}'.format(current))
+            state.append((current, self.vizapp.get_data_version(current), tuple(self.vizapp.get_data(current).shape)))
+            provenance = self.vizapp.get_provenance(current)
+            if provenance is not None:
+                names.append(provenance['parent'])
+
+        return '"{}"'.format(hashlib.sha1(repr(state).encode()).hexdigest())
+
+    # ---------------------------------------------------------------
+    #
+    #  endpoints
+    #
+    # ---------------------------------------------------------------
+
+    def _describe(self, name):
+        data = self.vizapp.get_data(name)
+        return {'name': name, 'shape': list(data.shape), 'dtype': np.dtype(data.dtype).str}
+
+    def _datasets(self, query):
+        names = list(self.vizapp._3d_data) + list(self.vizapp._2d_data) + list(self.vizapp._1d_data)
+        return self._json([self._describe(name) for name in names])
+
+    def _info(self, query, name):
+        return self._json(self._describe(name))
+
+    def _data(self, query, name):
+        return encode_array(self.vizapp.get_data(name))
+
+    def _slice(self, query, name, index):
+        data = self.vizapp.get_data(name)
+        if len(data.shape) != 3:
+            raise ValueError('{} is not a 3D dataset'.format(name))
+        return encode_array(data[int(index)])
+
+    def _tile(self, query, name, index=None):
+        data = self.vizapp.get_data(name)
+        window = (slice(int(query.get('y0', 0)), int(query['y1']) if 'y1' in query else None),
+                  slice(int(query.get('x0', 0)), int(query['x1']) if 'x1' in query else None))
+
+        if len(data.shape) == 3 and index is not None:
+            return encode_array(data[(int(index),) + window])
+        if len(data.shape) == 2 and index is None:
+            return encode_array(data[window])
+        raise ValueError('tile needs a slice index for 3D data and none for 2D data')
+
+    def _region(self, query, name):
+        data = self.vizapp.get_data(name)
+        if len(data.shape) != 3:
+            raise ValueError('{} is not a 3D dataset'.format(name))
+
+        region = tuple(slice(int(query.get(axis + '0', 0)), int(query[axis + '1']) if axis + '1' in query else None)
+                       for axis in ('z', 'y', 'x'))
+        return encode_array(data[region])
+
+    def _spectrum(self, query, name, y, x):
+        data = self.vizapp.get_data(name)
+        if len(data.shape) != 3:
+            raise ValueError('{} is not a 3D dataset'.format(name))
+        return encode_array(data[:, int(y), int(x)])
+
+    def _limits(self, query, name, index=None):
+        percentile = float(query['percentile']) if 'percentile' in query else None
+        index = int(index) if index is not None else None
+        low, high = self.vizapp.get_statistics(name).limits(index, percentile)
+        return self._json([float(low), float(high)])
+
+
+class VizAppServer:
+    """
+    HTTP server exposing the datasets of a VizApp as slice, tile and
+    spectrum endpoints, so that viewers in other kernels can run as thin
+    clients (see vizapp.client.RemoteVizApp) instead of loading their own
+    copy of the data. Requests are handled concurrently, one thread each.
+    """
+
+    def __init__(self, vizapp, host='127.0.0.1', port=0):
+        """
+
+        :param vizapp: VizApp - the application whose datasets to serve
+        :param host: str - address to listen on, localhost by default
+        :param port: int - port to listen on, 0 for any free port
+        """
+        self._httpd = http.server.ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.vizapp = vizapp
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def start(self):
+        """
+        Serve in a background thread.
+
+        :return: self
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._httpd.serve_forever, name='vizapp-server', daemon=True)
+            self._thread.start()
+            logger.debug('Serving on {}'.format(self.url))
+        return self
+
+    def stop(self):
+        """
+        Stop serving and close the socket.
+
+        :return: none
+        """
+        if self._thread is not None:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,436 @@
+import collections
+import itertools
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+
+import numpy as np
+
+from .references import function_reference, resolve_function
+from .views import DatasetView, encode_key, decode_key
+
+logger = logging.getLogger('session')
+
+FORMAT_VERSION = 2
+MANIFEST = 'manifest.json'
+
+# Target size, in bytes, of each chunk of a dataset on disk.
+CHUNK_BYTES = 1024 * 1024
+
+# Size, in pixels, of the spatial tiles of the chunks of 3D datasets.
+CHUNK_TILE = 32
+
+
+class ChunkedArray:
+    """
+    Read-only array stored on disk as chunks.
+
+    The chunks split the leading axes of the array, given by the length of the
+    chunk shape, and span the remaining axes whole. 3D datasets are split in
+    wavelength and in spatial tiles, so that both a slice and a spectrum only
+    read a few chunks.
+
+    Nothing is read until the array is indexed and then only the chunks that
+    cover the requested region are loaded. Uncompressed chunks are
+    memory-mapped, compressed chunks are decompressed on demand and the most
+    recently used ones are kept in memory.
+    """
+
+    def __init__(self, path, shape, dtype, chunk_shape, compressed, cache_size=64):
+        """
+
+        :param path: str - directory containing the chunk files
+        :param shape: tuple - shape of the full array
+        :param dtype: str - numpy dtype of the array
+        :param chunk_shape: tuple - shape of each chunk along the leading axes
+        :param compressed: bool - whether the chunks are compressed .npz files
+        :param cache_size: int - number of decompressed chunks to keep in memory
+        """
+        self._path = path
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self._chunk_shape = tuple(chunk_shape)
+        self._compressed = compressed
+        self._cache_size = cache_size
+        self._cache = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    @property
+    def nchunks(self):
+        return int(np.prod([-(-n // size) for n, size in zip(self.shape, self._chunk_shape)]))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return '<ChunkedArray shape={} dtype={} path={}>'.format(self.shape, self.dtype, self._path)
+
+    def _relocate(self, path, chunk_shape, compressed):
+        # The same data was written again, e.g. when a session is saved over
+        # the directory it was loaded from: read the new chunks from now on.
+        with self._lock:
+            self._path = path
+            self._chunk_shape = tuple(chunk_shape)
+            self._compressed = compressed
+            self._cache.clear()
+
+    def _chunk(self, index):
+        with self._lock:
+            if index in self._cache:
+                self._cache.move_to_end(index)
+                return self._cache[index]
+
+        if self._compressed:
+            with np.load(_chunk_filename(self._path, index, True)) as npz:
+                chunk = npz['data']
+        else:
+            chunk = np.load(_chunk_filename(self._path, index, False), mmap_mode='r')
+
+        with self._lock:
+            self._cache[index] = chunk
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+        return chunk
+
+    def __getitem__(self, key):
+        if not isinstance(key, tuple):
+            key = (key,)
+
+        nsplit = len(self._chunk_shape)
+        if len(key) > self.ndim or not all(isinstance(k, (int, np.integer, slice)) for k in key):
+            return np.asarray(self)[key]
+
+        key = key + (slice(None),) * (self.ndim - len(key))
+        split, rest = key[:nsplit], (slice(None),) * nsplit + key[nsplit:]
+
+        # Indices along each split axis, and the chunk each one is in.
+        indices = []
+        for axis, k in enumerate(split):
+            n = self.shape[axis]
+            if isinstance(k, slice):
+                indices.append(np.arange(*k.indices(n)))
+            else:
+                if not -n <= k < n:
+                    raise IndexError('index {} is out of bounds for axis {} with size {}'.format(k, axis, n))
+                indices.append(np.array([k % n]))
+
+        trailing = np.broadcast_to(np.empty((), dtype=self.dtype), self.shape)[rest].shape[nsplit:]
+        out = np.empty(tuple(len(x) for x in indices) + trailing, dtype=self.dtype)
+
+        chunks = [x // size for x, size in zip(indices, self._chunk_shape)]
+        for index in itertools.product(*[np.unique(x) for x in chunks]):
+            positions = [np.flatnonzero(x == i) for x, i in zip(chunks, index)]
+            local = [x[p] - i * size for x, p, i, size in zip(indices, positions, index, self._chunk_shape)]
+            chunk = self._chunk(tuple(int(i) for i in index))
+            out[np.ix_(*positions)] = chunk[np.ix_(*local)][rest]
+
+        # Integer indices drop their axis.
+        return out[tuple(0 if isinstance(k, (int, np.integer)) else slice(None) for k in split)]
+
+    def __array__(self, dtype=None):
+        data = self[:]
+        if dtype is not None:
+            data = data.astype(dtype, copy=False)
+        return data
+
+
+def _chunk_filename(path, index, compressed):
+    return os.path.join(path, 'chunk-{}.{}'.format('-'.join('{:05d}'.format(i) for i in index),
+                                                   'npz' if compressed else 'npy'))
+
+
+def _chunk_shape(shape, dtype):
+    """
+    Shape of the chunks of a dataset: spatial tiles over a range of
+    wavelengths for 3D datasets, ranges of rows otherwise.
+    """
+    if len(shape) == 3:
+        tile = tuple(max(1, min(CHUNK_TILE, n)) for n in shape[1:])
+        rows = max(1, CHUNK_BYTES // (int(np.prod(tile)) * dtype.itemsize))
+        return (max(1, min(rows, shape[0])),) + tile
+
+    row_bytes = max(1, int(np.prod(shape[1:])) * dtype.itemsize)
+    return (max(1, min(CHUNK_BYTES // row_bytes, shape[0])),)
+
+
+# ---------------------------------------------------------------
+#
+#  encoding of processing references and parameters
+#
+# ---------------------------------------------------------------
+
+def _encode(value):
+    if isinstance(value, np.ndarray):
+        return {'__ndarray__': value.tolist(), 'dtype': str(value.dtype)}
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, tuple):
+        return {'__tuple__': [_encode(x) for x in value]}
+    if isinstance(value, list):
+        return [_encode(x) for x in value]
+    if isinstance(value, dict):
+        return {str(k): _encode(v) for k, v in value.items()}
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    raise TypeError('Can not save value {!r} of type {}'.format(value, type(value).__name__))
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        if '__ndarray__' in value:
+            return np.array(value['__ndarray__'], dtype=value['dtype'])
+        if '__tuple__' in value:
+            return tuple(_decode(x) for x in value['__tuple__'])
+        return {k: _decode(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_decode(x) for x in value]
+    return value
+
+
+def _encode_processing(processing):
+    encoded = []
+    for name, info in processing.items():
+        func = info['method'] if isinstance(info, dict) else info
+        reference = function_reference(func)
+        if reference is None:
+            logger.warning('Not saving processing {}, {} can not be referenced by name'.format(name, func))
+            continue
+
+        if isinstance(info, dict):
+            encoded.append({
+                'name': name,
+                'method': reference,
+                'data_parameter': info['data_parameter'],
+                'parameters': _encode(tuple(info['parameters']))
+            })
+        else:
+            encoded.append({'name': name, 'method': reference})
+
+    return encoded
+
+
+# ---------------------------------------------------------------
+#
+#  save and load
+#
+# ---------------------------------------------------------------
+
+def _save_dataset(path, data, compress):
+    os.makedirs(path)
+
+    shape, dtype = tuple(data.shape), np.dtype(data.dtype)
+    chunk_shape = _chunk_shape(shape, dtype)
+    counts = [-(-n // size) for n, size in zip(shape[1:], chunk_shape[1:])]
+
+    # Read each range of rows once and write its chunks.
+    for first, start in enumerate(range(0, shape[0], chunk_shape[0])):
+        rows = np.asarray(data[start:start + chunk_shape[0]])
+        for index in itertools.product(*[range(n) for n in counts]):
+            region = tuple(slice(i * size, (i + 1) * size) for i, size in zip(index, chunk_shape[1:]))
+            chunk = np.ascontiguousarray(rows[(slice(None),) + region])
+            if compress:
+                np.savez_compressed(_chunk_filename(path, (first,) + index, True), data=chunk)
+            else:
+                np.save(_chunk_filename(path, (first,) + index, False), chunk)
+
+    return {
+        'shape': list(shape),
+        'dtype': dtype.str,
+        'chunk_shape': list(chunk_shape),
+        'compressed': compress
+    }
+
+
+def save_session(vizapp, path, compress=True, overwrite=False):
+    """
+    Save the datasets, statistics, processing and history of a VizApp to a
+    session directory.
+
+    :param vizapp: VizApp - the application to save
+    :param path: str - directory to write, must not exist unless overwrite is set
+    :param compress: bool - compress the chunks (compressed chunks can not be
+                     memory-mapped when loading)
+    :param overwrite: bool - replace an existing session directory
+    :return: none
+    """
+    if os.path.exists(path) and not overwrite:
+        raise FileExistsError('save_session: {} already exists'.format(path))
+
+    # Write next to the destination and swap it in at the end, so that a
+    # session saved over itself can still read its lazily loaded datasets
+    # while it is written, and a failed save leaves the old one in place.
+    path = os.path.abspath(path)
+    temporary = '{}.tmp-{}'.format(path, uuid.uuid4().hex[:8])
+    try:
+        saved = _write_session(vizapp, temporary, compress)
+    except BaseException:
+        shutil.rmtree(temporary, ignore_errors=True)
+        raise
+
+    if not os.path.exists(path):
+        os.replace(temporary, path)
+        return
+
+    previous = '{}.old-{}'.format(path, uuid.uuid4().hex[:8])
+    os.replace(path, previous)
+    os.replace(temporary, path)
+
+    # Datasets read from the old directory now read the same data from the new one.
+    for data, dataset in saved:
+        if isinstance(data, ChunkedArray) and os.path.abspath(data._path).startswith(path + os.sep):
+            data._relocate(os.path.join(path, dataset['path']), dataset['chunk_shape'], dataset['compressed'])
+
+    shutil.rmtree(previous, ignore_errors=True)
+
+
+def _write_session(vizapp, path, compress):
+    """
+    Write a session directory, which must not exist.
+
+    :return: list - (data, dataset entry of the manifest) of the saved datasets
+    """
+    os.makedirs(os.path.join(path, 'data'))
+
+    saved = []
+    datasets = []
+    containers = (('3d', vizapp._3d_data), ('2d', vizapp._2d_data), ('1d', vizapp._1d_data))
+    for kind, container in containers:
+        for name, data in container.items():
+            directory = os.path.join('data', str(len(datasets)))
+            logger.debug('Saving {} {} to {}'.format(name, data.shape, directory))
+
+            if isinstance(data, DatasetView):
+                # Views are saved as how to make them, not as data.
+                provenance = data.provenance
+                datasets.append({
+                    'name': name,
+                    'kind': kind,
+                    'view': {
+                        'parent': provenance['parent'],
+                        'key': encode_key(provenance['key']),
+                        'axes': provenance['axes']
+                    }
+                })
+                continue
+
+            dataset = {'name': name, 'kind': kind, 'path': directory}
+            dataset.update(_save_dataset(os.path.join(path, directory), data, compress))
+
+            statistics = vizapp._3d_statistics.get(name) if kind == '3d' else None
+            if statistics is not None and statistics.done:
+                dataset['statistics'] = os.path.join(directory, 'statistics.npz')
+                np.savez_compressed(os.path.join(path, dataset['statistics']), **statistics.get_state())
+
+            if name in vizapp._grids:
+                dataset['grid'] = vizapp._grids[name].to_dict()
+
+            datasets.append(dataset)
+            saved.append((data, dataset))
+
+    try:
+        history = _encode(vizapp._history)
+    except TypeError as e:
+        logger.warning('Not saving history: {}'.format(e))
+        history = []
+
+    manifest = {
+        'version': FORMAT_VERSION,
+        'datasets': datasets,
+        'processing': {
+            '3d': _encode_processing(vizapp._3d_processing),
+            '2d': _encode_processing(vizapp._2d_processing),
+            '1d': _encode_processing(vizapp._1d_processing)
+        },
+        'history': history
+    }
+
+    with open(os.path.join(path, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    return saved
+
+
+def load_session(path, vizapp=None):
+    """
+    Load a session directory written by save_session. The datasets are not
+    read here, they are loaded lazily as they are indexed.
+
+    :param path: str - session directory
+    :param vizapp: VizApp - application to load into, a new one by default
+    :return: VizApp
+    """
+    from .vizapp import VizApp
+    from .reproject import Grid
+    from .statistics import SliceStatistics
+
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+
+    if manifest.get('version') not in (1, FORMAT_VERSION):
+        raise ValueError('load_session: unsupported session version {}'.format(manifest.get('version')))
+
+    if vizapp is None:
+        vizapp = VizApp()
+
+    for kind, processing in manifest['processing'].items():
+        for info in processing:
+            registered = getattr(vizapp, '_{}_processing'.format(kind)).get(info['name'])
+            if registered is not None and function_reference(
+                    registered['method'] if isinstance(registered, dict) else registered) == info['method']:
+                continue
+
+            try:
+                func = resolve_function(info['method'])
+            except (ImportError, AttributeError, ValueError) as e:
+                logger.warning('Not loading processing {}: {}'.format(info['name'], e))
+                continue
+
+            if kind == '3d':
+                vizapp.add_3d_processing(info['name'], func, info['data_parameter'], _decode(info['parameters']))
+            elif kind == '1d':
+                vizapp.add_1d_processing(info['name'], func, info['data_parameter'], _decode(info['parameters']))
+            else:
+                vizapp.add_2d_processing(info['name'], func)
+
+    for dataset in manifest['datasets']:
+        if 'view' in dataset:
+            continue
+
+        # Version 1 sessions are chunked along axis 0 only.
+        chunk_shape = dataset['chunk_shape'] if 'chunk_shape' in dataset else (dataset['chunk_size'],)
+        data = ChunkedArray(os.path.join(path, dataset['path']), dataset['shape'], dataset['dtype'],
+                            chunk_shape, dataset['compressed'])
+        grid = Grid.from_dict(dataset['grid']) if 'grid' in dataset else None
+
+        # The statistics are not started, slices that were not saved are
+        # computed as they are looked at.
+        statistics = None
+        if dataset['kind'] == '3d':
+            statistics = SliceStatistics(data)
+            if 'statistics' in dataset:
+                with np.load(os.path.join(path, dataset['statistics'])) as npz:
+                    statistics.set_state(dict(npz))
+
+        vizapp._register_data(dataset['name'], data, statistics=statistics, grid=grid)
+
+    # Views last, once their parents are there.
+    for dataset in manifest['datasets']:
+        if 'view' in dataset:
+            view = dataset['view']
+            vizapp.add_view(dataset['name'], view['parent'], decode_key(view['key']), view['axes'])
+
+    vizapp._history = _decode(manifest['history'])
+
+    return vizapp
@@ -0,0 +1,173 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import tempfile
+import uuid
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+logger = logging.getLogger('sharedmem')
+
+# Shared arrays created by this process, released at exit at the latest.
+_owned = {}
+
+# Segments attached to by this process, kept open while their arrays are used.
+_attached = {}
+
+
+class SharedArrayHandle:
+    """
+    Small, picklable description of a shared array. Send it to worker
+    processes instead of the data and call attach() there to get a numpy
+    array backed by the same memory, without a copy.
+    """
+
+    def __init__(self, kind, name, shape, dtype):
+        """
+
+        :param kind: str - 'shm' for a shared memory segment, 'memmap' for a file
+        :param name: str - name of the segment, or path of the file
+        :param shape: tuple - shape of the array
+        :param dtype: str - numpy dtype of the array
+        """
+        self.kind = kind
+        self.name = name
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype).str
+
+    def __repr__(self):
+        return '<SharedArrayHandle {} {} shape={} dtype={}>'.format(self.kind, self.name, self.shape, self.dtype)
+
+    def attach(self):
+        """
+        Get the shared array.
+
+        :return: numpy array
+        """
+        if self.name in _owned:
+            return _owned[self.name].array
+
+        if self.kind == 'memmap':
+            return np.load(self.name, mmap_mode='r+')
+
+        if self.name not in _attached:
+            _attached[self.name] = _open_segment(self.name)
+
+        return np.ndarray(self.shape, dtype=self.dtype, buffer=_attached[self.name].buf)
+
+    def detach(self):
+        """
+        Close this process's mapping of a shared memory segment. Arrays from
+        attach() must not be used afterwards.
+
+        :return: none
+        """
+        segment = _attached.pop(self.name, None)
+        if segment is not None:
+            try:
+                segment.close()
+            except BufferError:
+                logger.warning('Arrays of {} are still in use, not closing it'.format(self.name))
+                _attached[self.name] = segment
+
+
+def _open_segment(name):
+    # Only the owner should unlink the segment, so attaching must not leave
+    # it registered with a resource tracker that would unlink it when this
+    # process exits (track is new in Python 3.13).
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        pass
+
+    segment = shared_memory.SharedMemory(name=name)
+
+    # Processes started by multiprocessing share the resource tracker of
+    # their parent, where the segment already is, so there is nothing to undo.
+    if multiprocessing.parent_process() is None:
+        resource_tracker.unregister(segment._name, 'shared_memory')
+
+    return segment
+
+
+class SharedArray:
+    """
+    Copy of an array in a named shared memory segment or in a memory-mapped
+    .npy file, owned by this process. It is released, i.e. the segment is
+    unlinked or the file deleted, by release() or at interpreter exit.
+    """
+
+    def __init__(self, data, kind='shm', directory=None):
+        """
+
+        :param data: array-like - data to copy into shared memory
+        :param kind: str - 'shm' for a shared memory segment, 'memmap' for a file
+        :param directory: str - where to put the file for 'memmap', a temporary
+                          directory by default
+        """
+        data = np.asarray(data)
+
+        if kind == 'shm':
+            self._segment = shared_memory.SharedMemory(create=True, size=max(data.nbytes, 1),
+                                                       name='vizapp-' + uuid.uuid4().hex[:16])
+            name = self._segment.name
+            self._array = np.ndarray(data.shape, dtype=data.dtype, buffer=self._segment.buf)
+        elif kind == 'memmap':
+            self._segment = None
+            name = os.path.join(directory or tempfile.gettempdir(), 'vizapp-{}.npy'.format(uuid.uuid4().hex))
+            self._array = np.lib.format.open_memmap(name, mode='w+', dtype=data.dtype, shape=data.shape)
+        else:
+            raise ValueError('SharedArray: kind must be shm or memmap, got {}'.format(kind))
+
+        self._array[...] = data
+        self.handle = SharedArrayHandle(kind, name, data.shape, data.dtype)
+
+        _owned[name] = self
+        logger.debug('Shared {} {} as {}'.format(data.shape, data.dtype, self.handle))
+
+    @property
+    def array(self):
+        return self._array
+
+    def release(self):
+        """
+        Free the shared memory. Workers that are still attached keep their
+        mapping until they detach or exit.
+
+        :return: none
+        """
+        if _owned.pop(self.handle.name, None) is None:
+            return
+
+        logger.debug('Releasing {}'.format(self.handle))
+
+        if self.handle.kind == 'shm':
+            self._array = None
+            try:
+                self._segment.close()
+            except BufferError:
+                # Arrays from this segment are still referenced, the memory
+                # is freed once they are gone.
+                pass
+            self._segment.unlink()
+        else:
+            if isinstance(self._array, np.memmap):
+                self._array.flush()
+            self._array = None
+            try:
+                os.remove(self.handle.name)
+            except FileNotFoundError:
+                pass
+
+
+@atexit.register
+def release_all():
+    """
+    Release every shared array owned by this process.
+
+    :return: none
+    """
+    for shared in list(_owned.values()):
+        shared.release()
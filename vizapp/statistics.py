@@ -0,0 +1,371 @@
+import logging
+import threading
+import warnings
+
+import numpy as np
+
+logger = logging.getLogger('statistics')
+
+DEFAULT_PERCENTILES = (0.5, 1, 5, 50, 95, 99, 99.5)
+
+
+class SliceStatistics:
+    """
+    Per-slice and global statistics of a 3D dataset.
+
+    The statistics are computed in one pass over the slices (axis 0) of the
+    data, in a background thread, and stored so that the colour limits of any
+    slice are a simple lookup. A slice that is requested before the background
+    pass has reached it is computed on demand.
+
+    For each slice we keep the min, max, a set of percentiles and a histogram
+    (with its own bin edges). The global min and max are exact. The global
+    percentiles and histogram come from the count-weighted sum of the
+    per-slice CDFs, interpolated through each slice's histogram edges and
+    percentiles, so they are exact at the stored percentiles when the slices
+    are alike and close otherwise.
+    """
+
+    def __init__(self, data, percentiles=DEFAULT_PERCENTILES, bins=64):
+        """
+
+        :param data: 3D array-like, indexable by slice along axis 0
+        :param percentiles: tuple - percentiles to keep for each slice
+        :param bins: int - number of histogram bins per slice
+        """
+        if len(data.shape) != 3:
+            raise ValueError('SliceStatistics: data must be 3D, got shape {}'.format(data.shape))
+
+        self._data = data
+        self._percentiles = tuple(sorted(percentiles))
+        self._bins = bins
+
+        self._lock = threading.Lock()
+        self._thread = None
+        self._running = False
+        self._global = None
+
+        self._allocate(data.shape[0])
+
+    def _allocate(self, n):
+        self._computed = np.zeros(n, dtype=bool)
+        self._min = np.full(n, np.nan)
+        self._max = np.full(n, np.nan)
+        self._percentile_values = np.full((n, len(self._percentiles)), np.nan)
+        self._counts = np.zeros((n, self._bins), dtype=np.int64)
+        self._edges = np.zeros((n, self._bins + 1))
+
+    def __len__(self):
+        return len(self._computed)
+
+    @property
+    def percentiles(self):
+        return self._percentiles
+
+    @property
+    def done(self):
+        return bool(self._computed.all())
+
+    # ---------------------------------------------------------------
+    #
+    #  computation
+    #
+    # ---------------------------------------------------------------
+
+    def start(self):
+        """
+        Start computing the statistics of every slice in a background thread.
+
+        :return: self
+        """
+        with self._lock:
+            if self._running:
+                return self
+            self._running = True
+
+        self._thread = threading.Thread(target=self._run, name='vizapp-statistics', daemon=True)
+        self._thread.start()
+
+        return self
+
+    def wait(self, timeout=None):
+        """
+        Block until the background computation has finished.
+
+        :param timeout: float - seconds to wait, or None to wait forever
+        :return: bool - True if all slices have been computed
+        """
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+        return self.done
+
+    def _run(self):
+        logger.debug('Computing statistics of {} slices'.format(len(self)))
+
+        # Slices can be added while we run (see extend), so keep going until
+        # there is nothing left to compute.
+        while True:
+            with self._lock:
+                pending = np.flatnonzero(~self._computed)
+                if not len(pending):
+                    self._running = False
+                    break
+
+            for index in pending:
+                if not self._computed[index]:
+                    self._compute(index)
+
+        logger.debug('Finished computing statistics')
+
+    def _compute(self, index):
+        data = np.asarray(self._data[index], dtype=float)
+        finite = data[np.isfinite(data)]
+
+        if finite.size:
+            vmin, vmax = finite.min(), finite.max()
+            values = np.percentile(finite, self._percentiles)
+            counts, edges = np.histogram(finite, bins=self._bins, range=(vmin, vmax))
+        else:
+            vmin = vmax = np.nan
+            values = np.full(len(self._percentiles), np.nan)
+            counts, edges = np.zeros(self._bins, dtype=np.int64), np.zeros(self._bins + 1)
+
+        with self._lock:
+            self._min[index] = vmin
+            self._max[index] = vmax
+            self._percentile_values[index] = values
+            self._counts[index] = counts
+            self._edges[index] = edges
+            self._computed[index] = True
+            self._global = None
+
+    def extend(self, n):
+        """
+        Grow the statistics to n slices, e.g. after slices were appended to
+        the data. The new slices are computed in the background.
+
+        :param n: int - new number of slices
+        :return: self
+        """
+        grow = n - len(self)
+        if grow <= 0:
+            return self
+
+        with self._lock:
+            self._computed = np.concatenate((self._computed, np.zeros(grow, dtype=bool)))
+            self._min = np.concatenate((self._min, np.full(grow, np.nan)))
+            self._max = np.concatenate((self._max, np.full(grow, np.nan)))
+            self._percentile_values = np.concatenate(
+                (self._percentile_values, np.full((grow, len(self._percentiles)), np.nan)))
+            self._counts = np.concatenate((self._counts, np.zeros((grow, self._bins), dtype=np.int64)))
+            self._edges = np.concatenate((self._edges, np.zeros((grow, self._bins + 1))))
+            self._global = None
+
+        return self.start()
+
+    def _ensure(self, index):
+        if not self._computed[index]:
+            self._compute(index)
+
+    def _compute_global(self):
+        # Wait for the background pass rather than computing the same slices twice.
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join()
+
+        for index in np.flatnonzero(~self._computed):
+            self._compute(index)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            vmin, vmax = np.nanmin(self._min), np.nanmax(self._max)
+
+        if np.isfinite(vmin):
+            knots, cdf, weights = self._slice_cdfs()
+
+            # The global CDF is the count-weighted sum of the slice CDFs, the
+            # percentiles are found by bisection on it.
+            targets = np.array(self._percentiles) / 100
+            low, high = np.full(len(targets), vmin), np.full(len(targets), vmax)
+            for _ in range(40):
+                middle = 0.5 * (low + high)
+                below = _evaluate_cdf(knots, cdf, weights, middle) < targets
+                low, high = np.where(below, middle, low), np.where(below, high, middle)
+            values = 0.5 * (low + high)
+
+            edges = np.linspace(vmin, vmax, self._bins + 1)
+            counts = np.round(np.diff(_evaluate_cdf(knots, cdf, weights, edges)) * weights.sum()).astype(np.int64)
+        else:
+            counts, edges = np.zeros(self._bins, dtype=np.int64), np.zeros(self._bins + 1)
+            values = np.full(len(self._percentiles), np.nan)
+
+        return {
+            'min': vmin,
+            'max': vmax,
+            'percentiles': dict(zip(self._percentiles, values)),
+            'histogram': (counts, edges)
+        }
+
+    def _slice_cdfs(self):
+        """
+        Piecewise linear CDF of every slice that has finite values, through
+        its histogram edges and its percentiles.
+
+        :return: tuple - (knots, cumulative fractions at the knots, number of
+                 finite values), one row per slice
+        """
+        weights = self._counts.sum(axis=1)
+        keep = weights > 0
+
+        counts, edges, weights = self._counts[keep], self._edges[keep], weights[keep]
+        fractions = np.concatenate((np.zeros((len(counts), 1)), np.cumsum(counts, axis=1) / weights[:, None]), axis=1)
+
+        knots = np.concatenate((edges, self._percentile_values[keep]), axis=1)
+        cdf = np.concatenate((fractions, np.broadcast_to(np.array(self._percentiles) / 100,
+                                                        (len(counts), len(self._percentiles)))), axis=1)
+
+        order = np.lexsort((cdf, knots), axis=-1)
+        knots, cdf = np.take_along_axis(knots, order, axis=1), np.take_along_axis(cdf, order, axis=1)
+
+        # Histogram counts and interpolated percentiles can disagree slightly.
+        cdf = np.maximum.accumulate(cdf, axis=1)
+
+        return knots, cdf, weights.astype(float)
+
+    def get_state(self):
+        """
+        Get the computed statistics as a dict of arrays, e.g. to save them.
+
+        :return: dict - arrays of the statistics
+        """
+        return {
+            'percentiles': np.array(self._percentiles),
+            'computed': self._computed,
+            'min': self._min,
+            'max': self._max,
+            'percentile_values': self._percentile_values,
+            'counts': self._counts,
+            'edges': self._edges
+        }
+
+    def set_state(self, state):
+        """
+        Restore statistics previously returned by get_state().
+
+        :param state: dict - arrays of the statistics
+        :return: none
+        """
+        if tuple(state['percentiles']) != self._percentiles or state['counts'].shape[1] != self._bins:
+            raise ValueError('set_state: statistics were computed with different percentiles or bins')
+
+        if len(state['computed']) != len(self):
+            raise ValueError('set_state: statistics are for {} slices, data has {}'.format(
+                len(state['computed']), len(self)))
+
+        with self._lock:
+            self._computed = np.array(state['computed'], dtype=bool)
+            self._min = np.array(state['min'])
+            self._max = np.array(state['max'])
+            self._percentile_values = np.array(state['percentile_values'])
+            self._counts = np.array(state['counts'])
+            self._edges = np.array(state['edges'])
+            self._global = None
+
+    # ---------------------------------------------------------------
+    #
+    #  lookup
+    #
+    # ---------------------------------------------------------------
+
+    def get_global(self):
+        """
+        Get the statistics over the whole dataset.
+
+        :return: dict - min, max, percentiles and histogram
+        """
+        if self._global is None:
+            self._global = self._compute_global()
+        return self._global
+
+    def get_slice(self, index):
+        """
+        Get the statistics of one slice.
+
+        :param index: int - slice number
+        :return: dict - min, max, percentiles and histogram
+        """
+        self._ensure(index)
+
+        return {
+            'min': self._min[index],
+            'max': self._max[index],
+            'percentiles': dict(zip(self._percentiles, self._percentile_values[index])),
+            'histogram': (self._counts[index], self._edges[index])
+        }
+
+    def limits(self, index=None, percentile=None):
+        """
+        Colour limits of a slice, or of the whole dataset when index is None.
+
+        :param index: int - slice number, None for the global limits
+        :param percentile: float - lower percentile to clip at, the upper limit
+                           is the matching 100 - percentile. None or 0 for min/max.
+        :return: tuple - (low, high)
+        """
+        if percentile and (percentile not in self._percentiles or
+                           100 - percentile not in self._percentiles):
+            raise ValueError('limits: percentiles {} and {} are not both in {}'.format(
+                percentile, 100 - percentile, self._percentiles))
+
+        if index is None:
+            stats = self.get_global()
+            if not percentile:
+                return stats['min'], stats['max']
+            return stats['percentiles'][percentile], stats['percentiles'][100 - percentile]
+
+        self._ensure(index)
+
+        if not percentile:
+            return self._min[index], self._max[index]
+
+        return (self._percentile_values[index, self._percentiles.index(percentile)],
+                self._percentile_values[index, self._percentiles.index(100 - percentile)])
+
+    def histogram(self, index=None):
+        """
+        Histogram of a slice, or of the whole dataset when index is None.
+
+        :param index: int - slice number, None for the global histogram
+        :return: tuple - (counts, edges)
+        """
+        if index is None:
+            return self.get_global()['histogram']
+
+        self._ensure(index)
+        return self._counts[index], self._edges[index]
+
+
+def _evaluate_cdf(knots, cdf, weights, x):
+    """
+    Weighted sum of piecewise linear CDFs.
+
+    :param knots: 2D numpy array - sorted knots of each CDF, one per row
+    :param cdf: 2D numpy array - non-decreasing values at the knots, ending at 1
+    :param weights: 1D numpy array - weight of each CDF
+    :param x: 1D numpy array - where to evaluate
+    :return: 1D numpy array - the normalised sum at each x
+    """
+    rows = np.arange(len(knots))[:, None]
+    last = knots.shape[1] - 1
+
+    # Knots at or below x: none means 0, all means 1, otherwise interpolate.
+    index = (knots[:, :, None] <= x).sum(axis=1)
+    lo, hi = np.clip(index - 1, 0, last), np.clip(index, 0, last)
+
+    x0, x1 = knots[rows, lo], knots[rows, hi]
+    f0, f1 = cdf[rows, lo], cdf[rows, hi]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        values = np.where(x1 > x0, f0 + (f1 - f0) * (x - x0) / (x1 - x0), f0)
+    values = np.where(index == 0, 0.0, np.where(index > last, 1.0, values))
+
+    return weights @ values / weights.sum()
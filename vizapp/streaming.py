@@ -0,0 +1,295 @@
+import logging
+import warnings
+
+import numpy as np
+
+logger = logging.getLogger('streaming')
+
+
+class AppendableCube:
+    """
+    3D dataset that grows along axis 0 as slices are appended.
+
+    The slices are kept in a buffer whose capacity doubles as needed, so
+    appending is amortized constant time per slice. Running sums and counts
+    are updated on each append, so the mean collapse over axis 0 never has to
+    be recomputed from scratch. The median collapse is a running P-square
+    estimate (see RunningMedian), also updated on each append, so it is
+    approximate once more than 5 values were appended to a pixel. np.nanmean
+    and np.nanmedian over axis 0 of the cube are answered this way; the
+    exact median is nanmedian(exact=True).
+    """
+
+    def __init__(self, slice_shape, dtype=float, capacity=16):
+        """
+
+        :param slice_shape: tuple - (ny, nx) shape of each slice
+        :param dtype: numpy dtype of the data
+        :param capacity: int - number of slices to allocate initially
+        """
+        self._slice_shape = tuple(slice_shape)
+        self._length = 0
+
+        self._buffer = np.empty((capacity,) + self._slice_shape, dtype=dtype)
+
+        self._sum = np.zeros(self._slice_shape)
+        self._count = np.zeros(self._slice_shape, dtype=np.int64)
+
+        self._median = RunningMedian(self._slice_shape)
+
+        self._observers = []
+
+    @property
+    def data(self):
+        """
+        View of the slices appended so far.
+        """
+        return self._buffer[:self._length]
+
+    @property
+    def shape(self):
+        return (self._length,) + self._slice_shape
+
+    @property
+    def dtype(self):
+        return self._buffer.dtype
+
+    @property
+    def ndim(self):
+        return 3
+
+    def __len__(self):
+        return self._length
+
+    def __repr__(self):
+        return '<AppendableCube shape={} dtype={}>'.format(self.shape, self.dtype)
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def __array__(self, dtype=None):
+        if dtype is None:
+            return self.data
+        return self.data.astype(dtype, copy=False)
+
+    # ---------------------------------------------------------------
+    #
+    #  appending
+    #
+    # ---------------------------------------------------------------
+
+    def observe(self, callback):
+        """
+        Register a callback called as callback(cube, old_length, new_length)
+        after slices are appended.
+
+        :param callback: function
+        :return: none
+        """
+        self._observers.append(callback)
+
+    def unobserve(self, callback):
+        """
+        Remove a callback registered with observe().
+
+        :param callback: function
+        :return: none
+        """
+        if callback in self._observers:
+            self._observers.remove(callback)
+
+    def _grow(self, length):
+        capacity = len(self._buffer)
+        if length <= capacity:
+            return
+
+        while capacity < length:
+            capacity *= 2
+
+        logger.debug('Growing cube buffer to {} slices'.format(capacity))
+
+        buffer = np.empty((capacity,) + self._slice_shape, dtype=self.dtype)
+        buffer[:self._length] = self._buffer[:self._length]
+        self._buffer = buffer
+
+    def append(self, slices):
+        """
+        Append one slice (2D) or a chunk of slices (3D) to the cube.
+
+        :param slices: numpy array of shape (ny, nx) or (n, ny, nx)
+        :return: none
+        """
+        slices = np.asarray(slices, dtype=self.dtype)
+        if slices.shape == self._slice_shape:
+            slices = slices[np.newaxis]
+
+        if slices.shape[1:] != self._slice_shape:
+            raise ValueError('append: slices of shape {} do not match the cube slice shape {}'.format(
+                slices.shape[1:], self._slice_shape))
+
+        old_length, new_length = self._length, self._length + len(slices)
+
+        self._grow(new_length)
+        self._buffer[old_length:new_length] = slices
+
+        finite = np.isfinite(slices)
+        self._sum += np.where(finite, slices, 0).sum(axis=0)
+        self._count += finite.sum(axis=0)
+        for image in slices:
+            self._median.update(image)
+
+        self._length = new_length
+
+        for callback in list(self._observers):
+            callback(self, old_length, new_length)
+
+    # ---------------------------------------------------------------
+    #
+    #  running collapses
+    #
+    # ---------------------------------------------------------------
+
+    def nanmean(self):
+        """
+        Mean over axis 0, ignoring NaNs, from the running sums.
+
+        :return: 2D numpy array
+        """
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self._count > 0, self._sum / self._count, np.nan)
+
+    def nanmedian(self, exact=False):
+        """
+        Median over axis 0, ignoring NaNs, from the running estimate. It is
+        exact for pixels with at most 5 values and approximate beyond.
+
+        :param exact: bool - compute the exact median from the data instead
+        :return: 2D numpy array
+        """
+        if not exact:
+            return self._median.median()
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            return np.nanmedian(self.data, axis=0) if self._length else np.full(self._slice_shape, np.nan)
+
+    def __array_function__(self, func, types, args, kwargs):
+        if func in (np.nanmean, np.nanmedian) and ((args and args[0] is self) or kwargs.get('a') is self):
+            options = dict(kwargs)
+            options.pop('a', None)
+            axis = options.pop('axis', args[1] if len(args) > 1 else None)
+            if axis == 0 and len(args) <= 2 and not options:
+                return self.nanmean() if func is np.nanmean else self.nanmedian()
+
+        # Anything else is computed on the data appended so far.
+        args = [x.data if isinstance(x, AppendableCube) else x for x in args]
+        kwargs = {k: v.data if isinstance(v, AppendableCube) else v for k, v in kwargs.items()}
+        return func(*args, **kwargs)
+
+
+class RunningMedian:
+    """
+    Running median of every pixel of a sequence of images, with the P-square
+    algorithm (Jain & Chlamtac, 1985). Each pixel keeps five markers, the
+    minimum, the median, the maximum and two quartiles, whose heights are
+    adjusted with a piecewise parabolic fit as values arrive. Updating takes
+    constant time and memory per pixel whatever the number of images, but the
+    median is an estimate once a pixel has more than 5 values. NaNs are
+    skipped.
+    """
+
+    # Increments of the desired marker positions for each value, for the median.
+    _INCREMENTS = np.array([0, 0.25, 0.5, 0.75, 1])
+
+    def __init__(self, shape):
+        """
+
+        :param shape: tuple - shape of the images
+        """
+        self._shape = tuple(shape)
+        size = int(np.prod(self._shape))
+
+        # Number of values of each pixel, the marker heights (the first values
+        # until there are 5), the marker positions and their desired positions.
+        self._count = np.zeros(size, dtype=np.int64)
+        self._heights = np.zeros((5, size))
+        self._positions = np.tile(np.arange(5.0)[:, np.newaxis], (1, size))
+        self._desired = self._positions.copy()
+
+    def update(self, image):
+        """
+        Add an image to the running median.
+
+        :param image: numpy array of the shape of the images
+        :return: none
+        """
+        values = np.asarray(image, dtype=float).ravel()
+        valid = np.isfinite(values)
+
+        # Pixels with 5 values or more update their markers, the others keep
+        # the values as the marker heights, sorted when the fifth arrives.
+        running = np.flatnonzero(valid & (self._count >= 5))
+
+        starting = np.flatnonzero(valid & (self._count < 5))
+        if len(starting):
+            self._heights[self._count[starting], starting] = values[starting]
+            self._count[starting] += 1
+            full = starting[self._count[starting] == 5]
+            self._heights[:, full] = np.sort(self._heights[:, full], axis=0)
+
+        if not len(running):
+            return
+
+        x = values[running]
+        q = self._heights[:, running]
+        n = self._positions[:, running]
+
+        # Cell of the value between the markers, extending the extreme ones.
+        q[0] = np.minimum(q[0], x)
+        q[4] = np.maximum(q[4], x)
+        cell = (x >= q[1]).astype(int) + (x >= q[2]) + (x >= q[3])
+
+        n += np.arange(5)[:, np.newaxis] > cell
+        desired = self._desired[:, running] + self._INCREMENTS[:, np.newaxis]
+
+        # Move the middle markers that are off their desired position by a step.
+        with np.errstate(invalid='ignore', divide='ignore'):
+            for i in (1, 2, 3):
+                offset = desired[i] - n[i]
+                up = (offset >= 1) & (n[i + 1] - n[i] > 1)
+                down = (offset <= -1) & (n[i - 1] - n[i] < -1)
+                step = np.where(up, 1.0, -1.0)
+
+                parabolic = q[i] + step / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + step) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                    (n[i + 1] - n[i] - step) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                neighbor = np.where(up, i + 1, i - 1)
+                linear = q[i] + step * (q[neighbor, np.arange(len(x))] - q[i]) / \
+                    (n[neighbor, np.arange(len(x))] - n[i])
+
+                move = up | down
+                q[i] = np.where(move, np.where((q[i - 1] < parabolic) & (parabolic < q[i + 1]), parabolic, linear), q[i])
+                n[i] += np.where(move, step, 0)
+
+        self._heights[:, running] = q
+        self._positions[:, running] = n
+        self._desired[:, running] = desired
+        self._count[running] += 1
+
+    def median(self):
+        """
+        Median of each pixel: exact with at most 5 values, estimated beyond
+        and NaN with none.
+
+        :return: numpy array of the shape of the images
+        """
+        median = self._heights[2].copy()
+
+        few = np.flatnonzero(self._count < 5)
+        if len(few):
+            values = np.where(np.arange(5)[:, np.newaxis] < self._count[few], self._heights[:, few], np.nan)
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', RuntimeWarning)
+                median[few] = np.nanmedian(values, axis=0)
+
+        return median.reshape(self._shape)
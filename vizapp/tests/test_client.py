@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from vizapp.client import RemoteArray, RemoteVizApp
+from vizapp.server import VizAppServer, _Handler
+from vizapp.vizapp import VizApp
+
+
+@pytest.fixture
+def requests(monkeypatch):
+    # Paths requested from the server, without their query.
+    paths = []
+    do_get = _Handler.do_GET
+
+    def recording_do_get(self):
+        paths.append(self.path.split('?')[0])
+        return do_get(self)
+
+    monkeypatch.setattr(_Handler, 'do_GET', recording_do_get)
+    return paths
+
+
+@pytest.fixture
+def cube():
+    return np.random.default_rng(0).normal(size=(20, 30, 40))
+
+
+@pytest.fixture
+def remote(cube):
+    vizapp = VizApp()
+    vizapp.add_data('cube', cube)
+    vizapp.add_data('image', cube[0])
+
+    with VizAppServer(vizapp) as server:
+        yield RemoteVizApp(server.url), vizapp
+
+
+def test_indexing(remote, cube, requests):
+    data = remote[0].get_data('cube')
+    assert isinstance(data, RemoteArray)
+
+    for key in [3, (3, slice(5, 20), slice(None, 30)), (slice(None), 4, 6), (slice(2, 9), slice(5, 25), slice(None)),
+                (slice(None, None, 2),)]:
+        assert np.array_equal(data[key], cube[key])
+
+    assert np.array_equal(np.asarray(remote[0].get_data('image')), cube[0])
+    assert requests.count('/datasets/cube/data') == 1
+
+
+def test_limits(remote):
+    remote_app, vizapp = remote
+    statistics = vizapp.get_statistics('cube')
+
+    assert remote_app.get_statistics('cube').limits(2, 1) == pytest.approx(statistics.limits(2, 1))
+    assert remote_app.get_statistics('cube').limits(None, 1) == pytest.approx(statistics.limits(None, 1))
+
+
+def test_pyramid_reads_regions(remote, cube, requests):
+    pyramid = remote[0].get_pyramid('cube')
+    data, _ = pyramid.region(0, ((0, 20), (0, 30), (0, 40)))
+
+    assert np.array_equal(data, cube)
+    assert '/datasets/cube/data' not in requests
@@ -0,0 +1,86 @@
+import warnings
+
+import numpy as np
+import pytest
+from scipy.signal import medfilt
+
+from vizapp.kernels import running_median, convolve
+
+
+def _nan_windows_median(a, kernel_size):
+    # Median of the valid values of each window, with windows cut at the edges.
+    half = kernel_size // 2
+    padded = np.concatenate([np.full(half, np.nan), a, np.full(half, np.nan)])
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        return np.array([np.nanmedian(padded[i:i + kernel_size]) for i in range(len(a))])
+
+
+@pytest.mark.parametrize('kernel_size', [1, 3, 5, 11])
+def test_running_median_matches_medfilt(kernel_size):
+    rng = np.random.default_rng(0)
+    a = rng.normal(size=200)
+    assert np.array_equal(running_median(a, kernel_size), medfilt(a, kernel_size))
+
+
+@pytest.mark.parametrize('kernel_size', [3, 5, 11])
+def test_running_median_ties(kernel_size):
+    rng = np.random.default_rng(1)
+    a = rng.integers(0, 3, size=200).astype(float)
+    assert np.array_equal(running_median(a, kernel_size), medfilt(a, kernel_size))
+
+
+@pytest.mark.parametrize('kernel_size', [3, 5, 11])
+def test_running_median_nans(kernel_size):
+    rng = np.random.default_rng(2)
+    a = rng.integers(0, 5, size=300).astype(float)
+    a[rng.random(300) < 0.3] = np.nan
+    a[100:120] = np.nan
+
+    expected = _nan_windows_median(a, kernel_size)
+    assert np.allclose(running_median(a, kernel_size, edge='nan'), expected, equal_nan=True)
+
+
+@pytest.mark.parametrize('axis', [0, 1, -1])
+def test_running_median_axis(axis):
+    rng = np.random.default_rng(3)
+    volume = rng.normal(size=(20, 15, 10))
+
+    result = running_median(volume, 5, axis=axis)
+    expected = np.apply_along_axis(medfilt, axis, volume, 5)
+    assert result.shape == volume.shape
+    assert np.array_equal(result, expected)
+
+
+def test_running_median_even_kernel():
+    with pytest.raises(ValueError):
+        running_median(np.zeros(10), 4)
+
+
+@pytest.mark.parametrize('mode', ['full', 'same', 'valid'])
+@pytest.mark.parametrize('n, k', [(50, 5), (50, 1), (4, 9), (7, 7)])
+def test_convolve_matches_numpy(mode, n, k):
+    rng = np.random.default_rng(4)
+    a, w = rng.normal(size=n), rng.normal(size=k)
+    assert np.allclose(convolve(a, w, mode), np.convolve(a, w, mode), rtol=1e-12, atol=1e-12)
+
+
+def test_convolve_nans():
+    a = np.arange(10.0)
+    a[4] = np.nan
+    w = np.ones(3)
+
+    propagated = convolve(a, w, 'same')
+    assert np.array_equal(np.isnan(propagated), np.isnan(np.convolve(a, w, 'same')))
+
+    ignored = convolve(a, w, 'same', nan_policy='ignore')
+    assert not np.isnan(ignored).any()
+    assert ignored[4] == pytest.approx((3 + 5) / 2 * 3)
+
+
+def test_convolve_axis():
+    rng = np.random.default_rng(5)
+    volume, w = rng.normal(size=(6, 30, 4)), rng.normal(size=5)
+
+    expected = np.apply_along_axis(np.convolve, 1, volume, w, 'same')
+    assert np.allclose(convolve(volume, w, 'same', axis=1), expected)
@@ -0,0 +1,88 @@
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+from vizapp.server import VizAppServer
+from vizapp.vizapp import VizApp
+
+
+def _get(url, etag=None):
+    request = urllib.request.Request(url)
+    if etag is not None:
+        request.add_header('If-None-Match', etag)
+
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.headers.get('ETag'), response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.headers.get('ETag'), e.read()
+
+
+@pytest.fixture
+def vizapp():
+    vizapp = VizApp()
+    vizapp.add_data('cube', np.zeros((4, 5, 6)))
+    vizapp.add_appendable_data('live', (5, 6))
+    vizapp.append_data('live', np.zeros((2, 5, 6)))
+    vizapp.add_view('crop', 'cube', (slice(1, 3),))
+    return vizapp
+
+
+@pytest.fixture
+def server(vizapp):
+    with VizAppServer(vizapp) as server:
+        yield server
+
+
+def test_not_modified(server):
+    url = server.url + '/datasets/cube/slice/1'
+    status, etag, payload = _get(url)
+    assert status == 200 and etag and payload
+
+    status, again, payload = _get(url, etag)
+    assert status == 304 and again == etag and not payload
+
+
+def test_etag_changes_with_the_data(vizapp, server):
+    url = server.url + '/datasets/live/slice/0'
+    _, etag, _ = _get(url)
+
+    vizapp.append_data('live', np.ones((5, 6)))
+    status, new_etag, _ = _get(url, etag)
+    assert status == 200 and new_etag != etag
+
+    _, listing, _ = _get(server.url + '/datasets')
+    vizapp.add_data('cube', np.ones((4, 5, 6)))
+    assert _get(server.url + '/datasets', listing)[0] == 200
+
+
+def test_view_etag_follows_its_parent(vizapp, server):
+    url = server.url + '/datasets/crop/slice/0'
+    _, etag, _ = _get(url)
+
+    vizapp.add_data('cube', np.ones((4, 5, 6)))
+    status, _, _ = _get(url, etag)
+    assert status == 200
+
+
+def test_etags_differ_between_vizapps(server):
+    other = VizApp()
+    other.add_data('cube', np.zeros((4, 5, 6)))
+
+    with VizAppServer(other) as other_server:
+        path = '/datasets/cube/slice/1'
+        assert _get(server.url + path)[1] != _get(other_server.url + path)[1]
+
+
+def test_errors(server):
+    assert _get(server.url + '/datasets/nothing/slice/0')[0] == 404
+    assert _get(server.url + '/nowhere')[0] == 404
+    assert _get(server.url + '/datasets/cube/slice/10')[0] == 400
+
+
+def test_view_without_parent(vizapp, server):
+    # A view left without its parent is answered with an error, not a dropped connection.
+    vizapp._drop_data('cube')
+    assert _get(server.url + '/datasets/crop/slice/0')[0] == 400
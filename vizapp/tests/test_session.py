@@ -0,0 +1,112 @@
+import os
+
+import numpy as np
+import pytest
+
+from vizapp import session
+from vizapp.reproject import Grid
+from vizapp.session import ChunkedArray, save_session, load_session
+from vizapp.vizapp import VizApp
+
+
+@pytest.fixture
+def vizapp():
+    rng = np.random.default_rng(0)
+
+    vizapp = VizApp()
+    vizapp.add_data('cube', rng.normal(size=(30, 40, 50)))
+    vizapp.add_data('image', rng.normal(size=(40, 50)))
+    vizapp.add_data('spectrum', rng.normal(size=30))
+    vizapp.add_view('cutout', 'cube', (slice(2, 20), slice(5, 35, 2)))
+    vizapp.set_grid('image', Grid((40, 50), origin=(1, 2), scale=(0.5, 0.5), rotation=10))
+    vizapp.get_statistics('cube').get_global()
+    return vizapp
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(session, 'CHUNK_BYTES', 16 * 1024)
+    monkeypatch.setattr(session, 'CHUNK_TILE', 16)
+
+
+@pytest.mark.parametrize('compress', [True, False])
+def test_round_trip(vizapp, small_chunks, tmp_path, compress):
+    path = str(tmp_path / 'session')
+    save_session(vizapp, path, compress=compress)
+    loaded = load_session(path)
+
+    for name in ('cube', 'image', 'spectrum', 'cutout'):
+        assert np.array_equal(np.asarray(loaded.get_data(name)), np.asarray(vizapp.get_data(name)))
+
+    assert loaded.get_provenance('cutout') == vizapp.get_provenance('cutout')
+    assert loaded.get_grid('image') == vizapp.get_grid('image')
+    assert loaded.get_statistics('cube').limits(3, 1) == vizapp.get_statistics('cube').limits(3, 1)
+    assert set(loaded._3d_processing) == set(vizapp._3d_processing)
+
+
+def test_chunked_indexing(vizapp, small_chunks, tmp_path):
+    path = str(tmp_path / 'session')
+    save_session(vizapp, path)
+    cube = load_session(path).get_data('cube')
+    expected = vizapp.get_data('cube')
+
+    assert isinstance(cube, ChunkedArray)
+    assert cube.nchunks > 1 and len(cube._chunk_shape) == 3
+
+    for key in [0, -1, (slice(None), 7, 9), (slice(3, 25, 4), slice(None, None, -3), 5),
+                (slice(5, 5),), (2, slice(1, 30, 2)), (Ellipsis, 3), [1, 4]]:
+        assert np.array_equal(cube[key], expected[key])
+
+    with pytest.raises(IndexError):
+        cube[30]
+
+
+def test_spectrum_reads_one_tile_column(small_chunks, tmp_path):
+    # Only the cube, so that nothing else, e.g. the statistics of a view,
+    # reads it in the background.
+    vizapp = VizApp()
+    vizapp.add_data('cube', np.zeros((30, 40, 50)))
+
+    path = str(tmp_path / 'session')
+    save_session(vizapp, path)
+    cube = load_session(path).get_data('cube')
+
+    read = []
+    chunk = cube._chunk
+
+    def counting_chunk(index):
+        read.append(index)
+        return chunk(index)
+
+    cube._chunk = counting_chunk
+    cube[:, 20, 20]
+
+    assert len(read) == -(-30 // cube._chunk_shape[0])
+    assert len({index[1:] for index in read}) == 1
+
+
+def test_overwrite(vizapp, tmp_path):
+    path = str(tmp_path / 'session')
+    save_session(vizapp, path)
+
+    with pytest.raises(FileExistsError):
+        save_session(vizapp, path)
+
+    # Saving a loaded session over itself, while its data is read lazily from there.
+    loaded = load_session(path)
+    loaded.add_data('extra', np.arange(10.0))
+    save_session(loaded, path, overwrite=True)
+
+    assert np.array_equal(np.asarray(loaded.get_data('cube')), vizapp.get_data('cube'))
+    assert np.array_equal(np.asarray(load_session(path).get_data('extra')), np.arange(10.0))
+    assert sorted(os.listdir(str(tmp_path))) == ['session']
+
+
+def test_unsupported_version(vizapp, tmp_path, monkeypatch):
+    path = str(tmp_path / 'session')
+    monkeypatch.setattr(session, 'FORMAT_VERSION', 99)
+    save_session(vizapp, path)
+    monkeypatch.undo()
+
+    with pytest.raises(ValueError):
+        load_session(path)
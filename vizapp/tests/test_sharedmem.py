@@ -0,0 +1,91 @@
+import multiprocessing
+import os
+
+import numpy as np
+import pytest
+
+from vizapp.sharedmem import SharedArrayHandle
+from vizapp.vizapp import VizApp
+
+
+def _sum_shared(handle):
+    array = handle.attach()
+    try:
+        return float(array.sum())
+    finally:
+        del array
+        handle.detach()
+
+
+@pytest.fixture
+def vizapp():
+    vizapp = VizApp()
+    vizapp.add_data('cube', np.arange(60, dtype=float).reshape(3, 4, 5))
+    return vizapp
+
+
+@pytest.mark.parametrize('kind', ['shm', 'memmap'])
+def test_attach_in_workers(vizapp, kind, tmp_path):
+    handle = vizapp.share_data('cube', kind=kind, directory=str(tmp_path))
+    assert isinstance(handle, SharedArrayHandle)
+    assert vizapp.share_data('cube') is handle
+    assert vizapp.get_handle('cube') is handle
+
+    with multiprocessing.get_context('spawn').Pool(2) as pool:
+        assert pool.map(_sum_shared, [handle] * 2) == [np.arange(60).sum()] * 2
+
+    # The dataset now reads the shared memory, without a copy.
+    assert np.shares_memory(vizapp.get_data('cube'), handle.attach())
+    vizapp.remove_data('cube')
+
+
+def test_release_on_remove(vizapp):
+    handle = vizapp.share_data('cube')
+    vizapp.remove_data('cube')
+
+    assert vizapp.get_handle('cube') is None
+    with pytest.raises(FileNotFoundError):
+        handle.attach()
+
+
+def test_release_on_replace(vizapp, tmp_path):
+    handle = vizapp.share_data('cube', kind='memmap', directory=str(tmp_path))
+    assert os.path.exists(handle.name)
+
+    vizapp.add_data('cube', np.zeros((3, 4, 5)))
+    assert not os.path.exists(handle.name)
+
+
+def test_views_read_shared_parent(vizapp):
+    vizapp.add_view('crop', 'cube', (slice(1, None), 2))
+    vizapp.share_data('cube')
+
+    assert np.shares_memory(np.asarray(vizapp.get_data('crop')), vizapp.get_data('cube'))
+    assert np.array_equal(np.asarray(vizapp.get_data('crop')), np.arange(60.0).reshape(3, 4, 5)[1:, 2])
+
+    vizapp.remove_data('crop')
+    vizapp.remove_data('cube')
+
+
+def test_refuse_to_share(vizapp):
+    vizapp.add_view('crop', 'cube', (slice(1, None),))
+    vizapp.add_appendable_data('live', (4, 5))
+
+    for name in ('crop', 'live'):
+        with pytest.raises(TypeError):
+            vizapp.share_data(name)
+
+
+def test_refuse_to_remove_parent_of_views(vizapp):
+    vizapp.add_view('crop', 'cube', (slice(1, None),))
+    vizapp.add_view('image', 'crop', (0,))
+
+    with pytest.raises(ValueError):
+        vizapp.remove_data('cube')
+    with pytest.raises(ValueError):
+        vizapp.remove_data('crop')
+
+    vizapp.remove_data('image')
+    vizapp.remove_data('crop')
+    vizapp.remove_data('cube')
+    assert vizapp.get_data('cube') is None
@@ -0,0 +1,66 @@
+import numpy as np
+import pytest
+
+from vizapp.streaming import AppendableCube, RunningMedian
+
+
+def test_append_and_grow():
+    cube = AppendableCube((4, 5), capacity=2)
+    data = np.arange(7 * 4 * 5, dtype=float).reshape(7, 4, 5)
+
+    cube.append(data[0])
+    cube.append(data[1:])
+
+    assert cube.shape == (7, 4, 5)
+    assert np.array_equal(cube.data, data)
+
+    with pytest.raises(ValueError):
+        cube.append(np.zeros((2, 3)))
+
+
+def test_nanmean():
+    rng = np.random.default_rng(0)
+    data = rng.normal(size=(50, 6, 7))
+    data[rng.random(data.shape) < 0.2] = np.nan
+
+    cube = AppendableCube((6, 7))
+    for chunk in np.array_split(data, 7):
+        cube.append(chunk)
+
+    assert np.allclose(np.nanmean(cube, axis=0), np.nanmean(data, axis=0))
+
+
+@pytest.mark.parametrize('length', [0, 1, 2, 4, 5])
+def test_running_median_exact_for_few_values(length):
+    rng = np.random.default_rng(1)
+    data = rng.normal(size=(length, 3, 4))
+
+    median = RunningMedian((3, 4))
+    for image in data:
+        median.update(image)
+
+    expected = np.median(data, axis=0) if length else np.full((3, 4), np.nan)
+    assert np.allclose(median.median(), expected, equal_nan=True)
+
+
+@pytest.mark.parametrize('distribution', ['normal', 'exponential', 'integers'])
+def test_running_median_estimate(distribution):
+    rng = np.random.default_rng(2)
+    shape = (2000, 10, 10)
+    if distribution == 'normal':
+        data = rng.normal(size=shape)
+    elif distribution == 'exponential':
+        data = rng.exponential(size=shape)
+    else:
+        data = rng.integers(0, 5, size=shape).astype(float)
+    data[rng.random(shape) < 0.1] = np.nan
+
+    cube = AppendableCube(shape[1:])
+    for chunk in np.array_split(data, 200):
+        cube.append(chunk)
+
+    exact = np.nanmedian(data, axis=0)
+    spread = np.nanpercentile(data, 75, axis=0) - np.nanpercentile(data, 25, axis=0)
+
+    assert np.array_equal(cube.nanmedian(exact=True), exact)
+    assert np.all(np.abs(np.nanmedian(cube, axis=0) - exact) < 0.05 * spread)
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from vizapp.reproject import Grid
+from vizapp.views import DatasetView
+from vizapp.vizapp import VizApp
+
+
+@pytest.fixture
+def vizapp():
+    vizapp = VizApp()
+    vizapp.add_data('cube', np.arange(20 * 30 * 40, dtype=float).reshape(20, 30, 40))
+    return vizapp
+
+
+VIEW_KEYS = [
+    ((slice(2, 18, 3), slice(None, None, -2), slice(5, 35)), None),
+    ((slice(None), slice(4, 20)), (2, 0, 1)),
+    ((5,), None),
+    ((slice(10, 2, -1), 7), (1, 0)),
+]
+
+ITEMS = [(), 0, -1, (slice(1, None, 2),), (slice(None), 3), (1, slice(None, None, -1), 2), (Ellipsis,)]
+
+
+@pytest.mark.parametrize('key, axes', VIEW_KEYS)
+@pytest.mark.parametrize('item', ITEMS)
+def test_index_composition(vizapp, key, axes, item):
+    view = vizapp.add_view('view', 'cube', key, axes)
+
+    expected = vizapp.get_data('cube')[key]
+    if axes is not None:
+        expected = expected.transpose(axes)
+
+    assert view.shape == expected.shape
+    assert np.array_equal(np.asarray(view), expected)
+
+    try:
+        expected = expected[item]
+    except IndexError:
+        with pytest.raises(IndexError):
+            view[item]
+    else:
+        assert np.array_equal(view[item], expected)
+
+
+def test_view_of_view(vizapp):
+    vizapp.add_view('crop', 'cube', (slice(2, 18), slice(4, 24, 2)))
+    vizapp.add_view('swapped', 'crop', axes=(0, 2, 1))
+    view = vizapp.add_view('spectrum', 'swapped', (slice(None, None, -1), 3, 5))
+
+    assert isinstance(view, DatasetView)
+    assert np.array_equal(np.asarray(view), vizapp.get_data('cube')[17:1:-1, 14, 3])
+    assert 'spectrum' in vizapp._1d_data
+
+
+def test_views_follow_their_parent(vizapp):
+    vizapp.add_view('crop', 'cube', (slice(2, 10),))
+    vizapp.add_view('image', 'crop', (0,))
+    versions = [vizapp.get_data_version(name) for name in ('crop', 'image')]
+    limits = vizapp.get_statistics('crop').limits(0)
+
+    vizapp.add_data('cube', 1000 * vizapp.get_data('cube'))
+
+    assert all(vizapp.get_data_version(name) != version for name, version in zip(('crop', 'image'), versions))
+    assert vizapp.get_statistics('crop').limits(0) == (1000 * limits[0], 1000 * limits[1])
+
+
+def test_views_of_appendable_data():
+    vizapp = VizApp()
+    vizapp.add_appendable_data('live', (8, 10))
+    vizapp.append_data('live', np.zeros((3, 8, 10)))
+    vizapp.add_view('crop', 'live', (slice(None), slice(2, 6)))
+    assert vizapp.get_pyramid('crop').shape == (3, 4, 10)
+
+    vizapp.append_data('live', np.ones((4, 8, 10)))
+
+    assert vizapp.get_pyramid('crop').shape == (7, 4, 10)
+    assert vizapp.get_statistics('crop').limits(6) == (1, 1)
+
+
+def test_views_that_no_longer_fit_are_removed(vizapp):
+    vizapp.add_view('image', 'cube', (3,))
+    vizapp.add_data('cube', np.zeros((30, 40)))
+
+    assert vizapp.get_data('image') is None
+
+
+def test_view_grid(vizapp):
+    grid = Grid((30, 40), origin=(10, 20), scale=(0.5, 2), rotation=30)
+    vizapp.set_grid('cube', grid)
+    vizapp.add_view('crop', 'cube', (slice(None), slice(5, 25, 2), slice(None, None, -3)))
+
+    view_grid = vizapp.get_grid('crop')
+    assert view_grid.shape == vizapp.get_data('crop').shape[-2:]
+
+    y, x = np.indices(view_grid.shape)
+    assert np.allclose(view_grid.pixel_to_world(y, x), grid.pixel_to_world(5 + 2 * y, 39 - 3 * x))
+
+
+def test_view_grid_needs_the_spatial_axes(vizapp):
+    vizapp.add_view('swapped', 'cube', axes=(0, 2, 1))
+    with pytest.raises(ValueError):
+        vizapp.get_grid('swapped')
+
+    vizapp.set_grid('swapped', Grid((40, 30)))
+    assert vizapp.get_grid('swapped').shape == (40, 30)
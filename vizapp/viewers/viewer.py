@@ -1,5 +1,38 @@
+import ast
+
+
+def parse_parameter(text):
+    """
+    Value of a processing parameter typed in a text box: a Python literal,
+    e.g. (1, 2) or 'same', or else the text itself, e.g. same.
+
+    :param text: str - content of the text box
+    :return: the value
+    """
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return text
+
+
 class Viewer:
 
     def __init__(self, vizapp):
 
         self._vizapp = vizapp
+
+        # The figure is built by render(), when the viewer is first shown.
+        self._fig = None
+
+    def _build_figure(self):
+        raise NotImplementedError('Must be implemented in a sub-class')
+
+    def render(self):
+        """
+        Build the figure, if it has not been built yet.
+
+        :return: the figure
+        """
+        if self._fig is None:
+            self._fig = self._build_figure()
+        return self._fig
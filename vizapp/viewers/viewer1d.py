@@ -1,16 +1,10 @@
 import logging
 
 import numpy as np
-import plotly.graph_objs as go
 from ipywidgets import IntSlider, Dropdown, HBox, VBox, Label, Text, FloatText, Button, IntText
 
-from .viewer import Viewer
-
-logging.basicConfig(filename='/tmp/vizapp.log',
-                            filemode='a',
-                            format='%(asctime)s,%(msecs)d %(name)s %(levelname)s %(message)s',
-                            datefmt='%H:%M:%S',
-                            level=logging.DEBUG)
+from ..backends import load_backend
+from .viewer import Viewer, parse_parameter
 
 logger = logging.getLogger('viewer1d')
 
@@ -23,6 +17,8 @@ class Viewer1D(Viewer):
 
         self._theoverlay = None
 
+        self._current_slice = 0
+
         # Slice slider
         self._slice_slider = IntSlider(description='Slice #:', max=10)
         self._slice_slider.observe(self._slice_slider_on_value_change)
@@ -43,10 +39,6 @@ class Viewer1D(Viewer):
         self._processing_dropdown.observe(self._processing_dropdown_on_change)
         self._processing_vbox = VBox([])
 
-        self._show_plot()
-
-        self._fig = go.FigureWidget(self._gofig)
-
         self._line1 = HBox([self._data_dropdown, self._overlay_dropdown])
 
 
@@ -180,10 +172,10 @@ class Viewer1D(Viewer):
         # Get the function
         function = self._processing_parameters['method']
 
-        # Need to see which parameters need to be passed to the function
-        params = {
-            self._processing_parameters['data_parameter']: data
-        }
+        # Need to see which parameters need to be passed to the function,
+        # starting from the defaults of those that have no widget (e.g. arrays)
+        params = dict(self._processing_parameters['parameters'])
+        params[self._processing_parameters['data_parameter']] = data
         for ii, row in enumerate(self._processing_vbox.children):
             logger.debug('{}th row is {}'.format(ii, row))
             if hasattr(row, 'children') and len(row.children) == 2 and isinstance(row.children[1], FloatText):
@@ -200,8 +192,7 @@ class Viewer1D(Viewer):
                 label, box = row.children
                 logger.debug('label is {}'.format(label))
                 logger.debug('box is {}'.format(box))
-                # TODO: Look into a better way of doing this.
-                params[label.value] = eval(box.value)
+                params[label.value] = parse_parameter(box.value)
 
         logger.debug('Got parameters {}'.format(params))
 
@@ -262,6 +253,8 @@ class Viewer1D(Viewer):
         raise NotImplementedError('Must be implemented in a sub-class')
 
     def show(self):
+        self.render()
+
         display(
             HBox([
                 VBox([
@@ -281,19 +274,29 @@ class PlotlyViewer1D(Viewer1D):
         super().__init__(*args, **kwargs)
 
     def _update_plot(self):
-        td = self._thedata
-        self._fig.data[0].update({'y': td})
+        if self._fig is None:
+            # Not shown yet, the figure is built with the current state.
+            return
 
-    def _show_plot(self):
+        td = np.asarray(self._thedata)
+        self._fig.data[0].update({'x': np.arange(len(td)), 'y': td})
 
-        self._current_slice = 0
+    def _build_figure(self):
+        go = load_backend('plotly')
+
+        self._show_plot()
+
+        return go.FigureWidget(self._gofig)
+
+    def _show_plot(self):
+        go = load_backend('plotly')
 
         colorscale = [(x, 'rgb({}, {}, {})'.format(int(x*255), int(x*255), int(x*255))) for x in np.arange(0, 1, 0.1)]
 
         self._trace1 = {
             "name": "data",
             "x": np.arange(len(self._thedata)),
-            "y": self._thedata,
+            "y": np.asarray(self._thedata),
             "showlegend": False,
             "type": "scatter"
         }
@@ -0,0 +1,218 @@
+import logging
+
+import numpy as np
+from ipywidgets import Dropdown, HBox, VBox, IntRangeSlider, IntText
+
+from ..backends import load_backend
+from .viewer import Viewer
+
+logger = logging.getLogger('viewer3d')
+
+
+class Viewer3D(Viewer):
+    """
+    Volume view of a 3D dataset.
+
+    The voxels shown come from the brick pyramid of the dataset (see
+    VizApp.get_pyramid). The wavelength, y and x range sliders select the
+    region to look at, and the finest level of the pyramid that fits that
+    region in the voxel budget is used, so zooming in loads full resolution
+    bricks only for the zoomed region.
+    """
+
+    def __init__(self, *args, max_voxels=100000, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        self._thedata_name = list(self._vizapp._3d_data.keys())[0]
+        self._thedata = self._vizapp.get_data(self._thedata_name)
+
+        # Data selector
+        self._data_dropdown = Dropdown(description='Data:', options=self._vizapp._3d_data.keys())
+        self._data_dropdown.observe(self._data_dropdown_on_change)
+
+        # Rendering selector
+        self._render_dropdown = Dropdown(description='Render:', options=['Volume', 'Isosurface'])
+        self._render_dropdown.observe(self._view_on_change)
+
+        # Level of detail selector
+        self._level_dropdown = Dropdown(description='Level:')
+        self._level_dropdown.observe(self._view_on_change)
+
+        # Voxel budget
+        self._voxels_text = IntText(description='Voxels:', value=max_voxels)
+        self._voxels_text.observe(self._view_on_change)
+
+        # Region sliders, in wavelength, y and x
+        self._range_sliders = [IntRangeSlider(description=description) for description in ('Wavelength:', 'y:', 'x:')]
+        for slider in self._range_sliders:
+            slider.observe(self._view_on_change)
+
+        self._reset_controls()
+
+        self._line1 = HBox([self._data_dropdown, self._render_dropdown])
+        self._line2 = HBox([self._level_dropdown, self._voxels_text])
+
+    def _reset_controls(self):
+        """
+        Set the level options and the range sliders for the current dataset.
+        """
+        pyramid = self._vizapp.get_pyramid(self._thedata_name)
+
+        self._updating = True
+        self._level_dropdown.options = [('Auto', -1)] + [
+            ('{} ({})'.format(level, 'x'.join(str(x) for x in pyramid.level_shape(level))), level)
+            for level in range(pyramid.nlevels)
+        ]
+        self._level_dropdown.value = -1
+
+        for slider, n in zip(self._range_sliders, pyramid.shape):
+            slider.min, slider.max = 0, n - 1
+            slider.value = (0, n - 1)
+        self._updating = False
+
+    def _get_view(self):
+        """
+        Voxels for the current region and level of detail.
+
+        Returns
+        -------
+        tuple
+            Level used, 3D array of voxels and the coordinates of the voxel
+            centers along each axis.
+        """
+        pyramid = self._vizapp.get_pyramid(self._thedata_name)
+        bounds = tuple((slider.value[0], slider.value[1] + 1) for slider in self._range_sliders)
+
+        level = self._level_dropdown.value
+        if level is None or level < 0:
+            level = pyramid.choose_level(bounds, self._voxels_text.value)
+
+        data, centers = pyramid.region(level, bounds)
+        logger.debug('Showing level {} of {}: {} voxels'.format(level, self._thedata_name, data.size))
+
+        return level, data, centers
+
+    def _data_dropdown_on_change(self, change):
+        """
+        Callback: Data dropdown change.
+
+        Parameters
+        ----------
+        change : dict
+            Change information from ipywidgets
+
+        Returns
+        -------
+
+        """
+        if change['type'] == 'change' and change['name'] == 'value':
+            self._thedata_name = change['new']
+            self._thedata = self._vizapp.get_data(change['new'])
+
+            self._reset_controls()
+            self._update_volume()
+
+    def _view_on_change(self, change):
+        """
+        Callback: Region, level, voxel budget or rendering change.
+
+        Parameters
+        ----------
+        change : dict
+            Change information from ipywidgets
+
+        Returns
+        -------
+
+        """
+        if change['type'] == 'change' and change['name'] == 'value' and not self._updating:
+            self._update_volume()
+
+    def _show_volume(self):
+        raise NotImplementedError('Must be implemented in a sub-class')
+
+    def _update_volume(self):
+        raise NotImplementedError('Must be implemented in a sub-class')
+
+    def show(self):
+        self.render()
+
+        display(
+            VBox([
+                self._line1,
+                self._line2,
+                self._fig,
+                VBox(self._range_sliders)
+            ])
+        )
+
+
+class PlotlyViewer3D(Viewer3D):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    def _trace(self):
+        level, data, centers = self._get_view()
+
+        # Plot x, y and wavelength as x, y and z
+        wavelength, y, x = np.meshgrid(*centers, indexing='ij')
+        isomin, isomax = self._vizapp.get_statistics(self._thedata_name).limits(None, 1)
+
+        trace = {
+            "name": "data",
+            "x": x.ravel(),
+            "y": y.ravel(),
+            "z": wavelength.ravel(),
+            "value": np.nan_to_num(data.ravel(), nan=isomin),
+            "isomin": isomin,
+            "isomax": isomax,
+            "colorscale": 'Greys',
+            "showlegend": False
+        }
+
+        if self._render_dropdown.value == 'Volume':
+            trace.update({"opacity": 0.1, "surface": {"count": 15}, "type": "volume"})
+        else:
+            trace.update({"surface": {"count": 3}, "caps": {"x": {"show": False}, "y": {"show": False},
+                                                            "z": {"show": False}}, "type": "isosurface"})
+
+        return trace
+
+    def _update_volume(self):
+        if self._fig is None:
+            # Not shown yet, the figure is built with the current state.
+            return
+
+        with self._fig.batch_update():
+            self._fig.data = []
+            self._fig.add_trace(self._trace())
+
+    def _build_figure(self):
+        go = load_backend('plotly')
+
+        self._show_volume()
+
+        return go.FigureWidget(self._gofig)
+
+    def _show_volume(self):
+        go = load_backend('plotly')
+
+        data2show = [self._trace()]
+
+        self._data = go.Data(data2show)
+
+        layout = {
+            "margin": {"r": 10},
+            "paper_bgcolor": "rgb(255,255,255)",
+            "width": 600,
+            "height": 600,
+            "scene": {
+                "xaxis": {"title": "x"},
+                "yaxis": {"title": "y"},
+                "zaxis": {"title": "wavelength"},
+                "aspectmode": "cube"
+            }
+        }
+
+        self._gofig = go.Figure(data=self._data, layout=layout)
@@ -1,33 +1,41 @@
 import logging
 
 import numpy as np
-import plotly.graph_objs as go
 from ipywidgets import IntSlider, Dropdown, HBox, VBox, Label, Text, FloatText, Button, IntText
 
-from .viewer import Viewer
+from ..backends import load_backend
+from .viewer import Viewer, parse_parameter
 
-logging.basicConfig(filename='/tmp/vizapp.log',
-                            filemode='a',
-                            format='%(asctime)s,%(msecs)d %(name)s %(levelname)s %(message)s',
-                            datefmt='%H:%M:%S',
-                            level=logging.DEBUG)
 logger = logging.getLogger('viewernd')
 
+# Colour scaling options, named by the upper percentile and mapped to the
+# lower percentile to clip at, e.g. 95% clips at the 5th and 95th percentiles.
+SCALE_OPTIONS = [
+    ('Min/Max', 0),
+    ('99.5%', 0.5),
+    ('99%', 1),
+    ('95%', 5),
+]
+
 class ViewerND(Viewer):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
-        self._thedata = self._vizapp.get_data(0)
+        self._thedata_name = list(self._vizapp._3d_data.keys())[0]
+        self._thedata = self._vizapp.get_data(self._thedata_name)
 
         self._theoverlay = None
 
+        self._current_slice = 0
+
         # Slice slider
         self._slice_slider = IntSlider(description='Slice #:', max=10)
         self._slice_slider.observe(self._slice_slider_on_value_change)
 
         # TODO: refactor this
-        self._slice_slider.max = self._thedata.shape[0]
+        self._slice_slider.max = self._thedata.shape[0] - 1
+        self._observe_data()
 
         # Data selector
         self._data_dropdown = Dropdown(description='Data:', options=self._vizapp._3d_data.keys())
@@ -42,11 +50,11 @@ class ViewerND(Viewer):
         self._processing_dropdown.observe(self._processing_dropdown_on_change)
         self._processing_vbox = VBox([])
 
-        self._show_image()
+        # Colour scaling selector
+        self._scale_dropdown = Dropdown(description='Scale:', options=SCALE_OPTIONS)
+        self._scale_dropdown.observe(self._scale_dropdown_on_change)
 
-        self._fig = go.FigureWidget(self._gofig)
-
-        self._line1 = HBox([self._data_dropdown, self._overlay_dropdown])
+        self._line1 = HBox([self._data_dropdown, self._overlay_dropdown, self._scale_dropdown])
 
 
     def _data_dropdown_on_change(self, change):
@@ -63,17 +71,55 @@ class ViewerND(Viewer):
 
         """
         if change['type'] == 'change' and change['name'] == 'value':
+            self._unobserve_data()
+
+            self._thedata_name = change['new']
             self._thedata = self._vizapp.get_data(change['new'])
+            self._observe_data()
 
             # Set the slice slider maximum
-            self._slice_slider.max = self._thedata.shape[0]
+            self._slice_slider.max = self._thedata.shape[0] - 1
 
             if self._current_slice > self._thedata.shape[0] - 1:
                 self._current_slice = self._thedata.shape[0] - 1
 
+            # The overlay is resampled onto the grid of the data
+            self._align_overlay()
+
             # Get the data and update the figure
             self._update_image()
 
+    def _observe_data(self):
+        """
+        Follow the growth of the current dataset if slices can be appended to it.
+        """
+        if hasattr(self._thedata, 'observe'):
+            self._thedata.observe(self._data_appended)
+
+    def _unobserve_data(self):
+        if hasattr(self._thedata, 'unobserve'):
+            self._thedata.unobserve(self._data_appended)
+
+    def _data_appended(self, data, old_length, new_length):
+        """
+        Callback: Slices appended to the current dataset.
+
+        Parameters
+        ----------
+        data : AppendableCube
+            The dataset that grew.
+        old_length : int
+            Number of slices before the append.
+        new_length : int
+            Number of slices after the append.
+
+        Returns
+        -------
+
+        """
+        logger.debug('data grew from {} to {} slices'.format(old_length, new_length))
+        self._slice_slider.max = new_length - 1
+
     def _overlay_dropdown_on_change(self, change):
         """
         Callback: 2D overlay call back change.
@@ -90,11 +136,51 @@ class ViewerND(Viewer):
 
         logger.debug('overlay_dropdown_on_change with change {}'.format(change))
         if change['type'] == 'change' and change['name'] == 'value':
-            self._theoverlay = self._vizapp.get_data(change['new'])
+            self._align_overlay()
 
             logger.debug('\tgoing to call update image')
             self._update_image()
 
+    def _align_overlay(self):
+        """
+        Resample the selected overlay onto the spatial grid of the current
+        dataset. The resampling operators are cached by the vizapp, so
+        switching between overlays does not rebuild them.
+        """
+        if self._overlay_dropdown.value == 'None':
+            self._theoverlay = None
+        else:
+            self._theoverlay = self._vizapp.get_aligned_data(self._overlay_dropdown.value, self._thedata_name)
+
+    def _scale_dropdown_on_change(self, change):
+        """
+        Callback: Colour scaling dropdown change.
+
+        Parameters
+        ----------
+        change : dict
+            Change information from ipywidgets
+
+        Returns
+        -------
+
+        """
+        if change['type'] == 'change' and change['name'] == 'value':
+            self._update_image()
+
+    def _get_limits(self):
+        """
+        Colour limits of the current slice, looked up in the cached statistics
+        of the dataset.
+
+        Returns
+        -------
+        tuple
+            (low, high) limits of the current slice.
+        """
+        statistics = self._vizapp.get_statistics(self._thedata_name)
+        return statistics.limits(self._current_slice, self._scale_dropdown.value)
+
     def _processing_dropdown_on_change(self, change):
         """
         Here we want to put the parameters and some buttons in the right hand
@@ -178,10 +264,10 @@ class ViewerND(Viewer):
         # Get the function
         function = self._processing_parameters['method']
 
-        # Need to see which parameters need to be passed to the function
-        params = {
-            self._processing_parameters['data_parameter']: data
-        }
+        # Need to see which parameters need to be passed to the function,
+        # starting from the defaults of those that have no widget (e.g. arrays)
+        params = dict(self._processing_parameters['parameters'])
+        params[self._processing_parameters['data_parameter']] = data
         for ii, row in enumerate(self._processing_vbox.children):
             logger.debug('{}th row is {}'.format(ii, row))
             if hasattr(row, 'children') and len(row.children) == 2 and isinstance(row.children[1], FloatText):
@@ -198,8 +284,7 @@ class ViewerND(Viewer):
                 label, box = row.children
                 logger.debug('label is {}'.format(label))
                 logger.debug('box is {}'.format(box))
-                # TODO: Look into a better way of doing this.
-                params[label.value] = eval(box.value)
+                params[label.value] = parse_parameter(box.value)
 
         logger.debug('Got parameters {}'.format(params))
 
@@ -260,6 +345,8 @@ class ViewerND(Viewer):
         raise NotImplementedError('Must be implemented in a sub-class')
 
     def show(self):
+        self.render()
+
         display(
             HBox([
                 VBox([
@@ -279,13 +366,19 @@ class PlotlyViewerND(ViewerND):
         super().__init__(*args, **kwargs)
 
     def _update_image(self):
+        if self._fig is None:
+            # Not shown yet, the figure is built with the current state.
+            return
+
         td = self._thedata[self._current_slice]
-        self._fig.data[0].update({'z': td})
+        ny, nx = td.shape
+        zmin, zmax = self._get_limits()
+        self._fig.data[0].update({'x': np.arange(nx), 'y': np.arange(ny), 'z': td, 'zmin': zmin, 'zmax': zmax})
 
-        if not self._overlay_dropdown.value == 'None':
+        if self._theoverlay is not None:
             self._fig.data[1].update({
-                "x": np.arange(74),
-                "y": np.arange(74),
+                "x": np.arange(nx),
+                "y": np.arange(ny),
                 "z": self._theoverlay,
                 "opacity": 0.5,
                 "showlegend": False
@@ -301,17 +394,32 @@ class PlotlyViewerND(ViewerND):
 
     def _scale255(self, data):
         logger.debug('Going to scale data of size {}'.format(data.shape))
-        return np.floor(255* (data - np.nanmin(data)) / (np.nanmax(data) - np.nanmin(data)))
+        zmin, zmax = self._get_limits()
+        return np.floor(255 * np.clip((data - zmin) / (zmax - zmin), 0, 1))
+
+    def _build_figure(self):
+        go = load_backend('plotly')
+
+        self._show_image()
+        self._fig = go.FigureWidget(self._gofig)
+
+        # The overlay may have been chosen before the viewer was shown.
+        self._update_image()
+
+        return self._fig
 
     def _show_image(self):
+        go = load_backend('plotly')
 
-        self._current_slice = 0
+        zmin, zmax = self._get_limits()
 
         self._trace1 = {
             "name": "data",
-            "x": np.arange(74),
-            "y": np.arange(74),
-            "z": self._thedata[0],
+            "x": np.arange(self._thedata.shape[-1]),
+            "y": np.arange(self._thedata.shape[-2]),
+            "z": self._thedata[self._current_slice],
+            "zmin": zmin,
+            "zmax": zmax,
             "colorscale": 'Greys',
             "showlegend": False,
             "type": "heatmap"
@@ -0,0 +1,166 @@
+import logging
+
+import numpy as np
+
+logger = logging.getLogger('views')
+
+
+def _normalize_key(key, ndim):
+    """
+    Expand a basic indexing key (ints and slices) to one entry per axis.
+    """
+    if key is None:
+        key = ()
+    if not isinstance(key, tuple):
+        key = (key,)
+
+    if len(key) > ndim:
+        raise IndexError('too many indices for a dataset with {} dimensions'.format(ndim))
+
+    for item in key:
+        if not isinstance(item, (int, np.integer, slice)):
+            raise TypeError('views only support int and slice indices, got {!r}'.format(item))
+
+    return tuple(int(x) if isinstance(x, np.integer) else x for x in key) + (slice(None),) * (ndim - len(key))
+
+
+def _range_to_slice(indices):
+    if not len(indices):
+        return slice(0, 0)
+    stop = indices[-1] + indices.step
+    return slice(indices[0], stop if stop >= 0 else None, indices.step)
+
+
+def encode_key(key):
+    """
+    Convert a view key to something that can be saved as JSON.
+    """
+    return [[x.start, x.stop, x.step] if isinstance(x, slice) else x for x in key]
+
+
+def decode_key(key):
+    return tuple(slice(*x) if isinstance(x, list) else x for x in key)
+
+
+class DatasetView:
+    """
+    Dataset defined as a view over another dataset of a VizApp: basic slices
+    (crops, strides, wavelength ranges) and an optional transpose of the axes.
+
+    Nothing is copied. Indexing the view indexes the parent, so for a numpy
+    parent the result is a numpy view and for a lazy parent (e.g. a saved
+    session) only the needed part is read. Converting the view to an array
+    returns a numpy view too, which may not be contiguous; materialize()
+    makes the contiguous copy for code that needs one.
+    """
+
+    def __init__(self, vizapp, parent, key=None, axes=None):
+        """
+
+        :param vizapp: VizApp - the application the parent is in
+        :param parent: str - name of the parent dataset
+        :param key: tuple - ints and slices applied to the parent
+        :param axes: tuple - permutation of the remaining axes, as np.transpose
+        """
+        self._vizapp = vizapp
+        self._parent = parent
+
+        parent_data = self._parent_data()
+        self._key = _normalize_key(key, len(parent_data.shape))
+
+        ndim = sum(isinstance(x, slice) for x in self._key)
+        if axes is not None and sorted(axes) != list(range(ndim)):
+            raise ValueError('axes {} are not a permutation of the {} axes of the view'.format(axes, ndim))
+        self._axes = tuple(axes) if axes is not None else None
+
+    def _parent_data(self):
+        data = self._vizapp.get_data(self._parent)
+        if data is None:
+            raise KeyError('The parent dataset {} of the view does not exist'.format(self._parent))
+        return data
+
+    @property
+    def parent(self):
+        return self._parent
+
+    @property
+    def provenance(self):
+        """
+        How the view is derived from its parent.
+        """
+        return {'parent': self._parent, 'key': self._key, 'axes': self._axes}
+
+    @property
+    def shape(self):
+        # Index a zero-strided array of the parent's shape, which costs nothing.
+        parent_shape = self._parent_data().shape
+        probe = np.lib.stride_tricks.as_strided(np.zeros(1), shape=parent_shape, strides=(0,) * len(parent_shape))
+        probe = probe[self._key]
+        if self._axes is not None:
+            probe = probe.transpose(self._axes)
+        return probe.shape
+
+    @property
+    def dtype(self):
+        return self._parent_data().dtype
+
+    @property
+    def ndim(self):
+        return len(self.shape)
+
+    @property
+    def size(self):
+        return int(np.prod(self.shape))
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __repr__(self):
+        return '<DatasetView of {} key={} axes={} shape={}>'.format(self._parent, self._key, self._axes, self.shape)
+
+    def _compose(self, item):
+        """
+        Combine an index into the view with the view's own key, giving the
+        parent key and the transpose to apply to the result.
+        """
+        view_axes = [ii for ii, x in enumerate(self._key) if isinstance(x, slice)]
+        order = [view_axes[ii] for ii in self._axes] if self._axes is not None else view_axes
+
+        item = _normalize_key(item, len(order))
+
+        key = list(self._key)
+        parent_shape = self._parent_data().shape
+        for parent_axis, index in zip(order, item):
+            indices = range(*key[parent_axis].indices(parent_shape[parent_axis]))[index]
+            key[parent_axis] = indices if isinstance(indices, int) else _range_to_slice(indices)
+
+        # The axes that remain, in the order the view shows them
+        remaining = [axis for axis, index in zip(order, item) if isinstance(index, slice)]
+        axes = [sorted(remaining).index(axis) for axis in remaining]
+
+        return tuple(key), axes
+
+    def __getitem__(self, item):
+        try:
+            key, axes = self._compose(item)
+        except TypeError:
+            # Anything but ints and slices is applied to the full view.
+            return np.asarray(self)[item]
+
+        data = self._parent_data()[key]
+        if axes != sorted(axes):
+            data = np.transpose(data, axes)
+        return data
+
+    def __array__(self, dtype=None):
+        data = self[()]
+        return np.asarray(data, dtype=dtype)
+
+    def materialize(self):
+        """
+        Copy the view into a contiguous numpy array.
+
+        :return: numpy array
+        """
+        logger.debug('Materializing view of {} {}'.format(self._parent, self.shape))
+        return np.ascontiguousarray(self)
@@ -1,17 +1,38 @@
 import inspect
+import itertools
 import logging
+import uuid
 
 import numpy as np
-import scipy.signal
 
-logging.basicConfig(filename='/tmp/vizapp.log',
-                            filemode='a',
-                            format='%(asctime)s,%(msecs)d %(name)s %(levelname)s %(message)s',
-                            datefmt='%H:%M:%S',
-                            level=logging.DEBUG)
+from .bricks import BrickPyramid
+from .references import resolve_function
+from .reproject import Grid, ResamplingCache
+from .session import save_session, load_session
+from .sharedmem import SharedArray
+from .statistics import SliceStatistics
+from .streaming import AppendableCube
+from .views import DatasetView
+
 logger = logging.getLogger('vizapp')
 
 
+def log_to_file(filename='/tmp/vizapp.log', level=logging.DEBUG):
+    """
+    Send the log messages of vizapp and its viewers to a file. Nothing is
+    configured on import, so batch jobs keep their own logging setup.
+
+    :param filename: str - file to append to
+    :param level: int - lowest level to log
+    :return: none
+    """
+    logging.basicConfig(filename=filename,
+                        filemode='a',
+                        format='%(asctime)s,%(msecs)d %(name)s %(levelname)s %(message)s',
+                        datefmt='%H:%M:%S',
+                        level=level)
+
+
 
 
 class VizApp:
@@ -24,20 +45,35 @@ class VizApp:
         self._2d_data = {}
         self._1d_data = {}
 
+        self._3d_statistics = {}
+        self._3d_pyramids = {}
+
+        # Versions count from 0 in every VizApp, the token tells them apart.
+        self._data_versions = {}
+        self._version_counter = itertools.count()
+        self._token = uuid.uuid4().hex
+
+        self._grids = {}
+        self._resampling = ResamplingCache()
+
+        self._shared = {}
+
         self._3d_processing = {}
         self.add_3d_processing("Median Collapse over Wavelenths", np.nanmedian, 'a', (('axis', 0),))
         self.add_3d_processing("Mean Collapse over Wavelenths", np.nanmean, 'a', (('axis', 0),))
         self.add_3d_processing("Median Collapse over Space", np.nanmedian, 'a', (('axis', (1,2)),))
         self.add_3d_processing("Mean Collapse over Space", np.nanmean, 'a', (('axis', (1,2)),))
+        self.add_3d_processing("Median Smoothing over Wavelengths", 'vizapp.kernels:running_median', 'volume', (('kernel_size', 3), ('axis', 0)))
+        self.add_3d_processing("Hanning Smoothing over Wavelengths", 'vizapp.kernels:convolve', 'a', (('mode', 'same'), ('axis', 0), ('w', np.hanning(3))))
 
         self._2d_processing = {}
 
         self._1d_processing = {}
-        self.add_1d_processing("Median Smoothing", scipy.signal.medfilt, 'volume', (('kernel_size', 3),))
-        self.add_1d_processing("Hanning Smoothing", np.convolve, 'a', (('mode', 'valid'), ('w', np.hanning(3))))
-        self.add_1d_processing("Hamming Smoothing", np.convolve, 'a', (('mode', 'valid'), ('w', np.hamming(3))))
-        self.add_1d_processing("Bartlett Smoothing", np.convolve, 'a', (('mode', 'valid'), ('w', np.bartlett(3))))
-        self.add_1d_processing("Blackman Smoothing", np.convolve, 'a', (('mode', 'valid'), ('w', np.blackman(3))))
+        self.add_1d_processing("Median Smoothing", 'vizapp.kernels:running_median', 'volume', (('kernel_size', 3),))
+        self.add_1d_processing("Hanning Smoothing", 'vizapp.kernels:convolve', 'a', (('mode', 'valid'), ('w', np.hanning(3))))
+        self.add_1d_processing("Hamming Smoothing", 'vizapp.kernels:convolve', 'a', (('mode', 'valid'), ('w', np.hamming(3))))
+        self.add_1d_processing("Bartlett Smoothing", 'vizapp.kernels:convolve', 'a', (('mode', 'valid'), ('w', np.bartlett(3))))
+        self.add_1d_processing("Blackman Smoothing", 'vizapp.kernels:convolve', 'a', (('mode', 'valid'), ('w', np.blackman(3))))
 
     # ---------------------------------------------------------------
     #
@@ -49,7 +85,8 @@ class VizApp:
         """
 
         :param name: str name to display
-        :param func: method  method to run
+        :param func: method  method to run, or its 'module:function' reference,
+                     which is only imported when the processing is used
         :param parameters: tuple - list of parameters
         :return: none
         """
@@ -58,7 +95,10 @@ class VizApp:
         if not isinstance(name, str):
             raise TypeError('add_3d_processing: name, {}, must be a string')
 
-        if not inspect.isfunction(func):
+        if isinstance(func, str):
+            if func.count(':') != 1:
+                raise ValueError('add_3d_processing: func, {}, must be a "module:function" reference'.format(func))
+        elif not inspect.isfunction(func):
             raise TypeError('add_3d_processing: func must be a method')
 
         if not isinstance(data_parameter, str):
@@ -90,13 +130,30 @@ class VizApp:
         # TODO: Fix the above description
 
         if name is not None:
-            return self._3d_processing[name]
+            return self._load_processing(self._3d_processing[name])
         else:
             return list(self._3d_processing.keys())
 
+    def _load_processing(self, processing):
+        """
+        Import the method of a processing registered by reference.
+
+        :param processing: dict - processing information
+        :return: dict - the same, with the method loaded
+        """
+        if isinstance(processing['method'], str):
+            try:
+                processing['method'] = resolve_function(processing['method'])
+            except (ImportError, AttributeError) as e:
+                raise ImportError('{}: can not load {}: {}'.format(
+                    processing['name'], processing['method'], e)) from e
+            logger.debug('Loaded {} for {}'.format(processing['method'], processing['name']))
+
+        return processing
+
     # TODO: Lots of things here: Need parameters, add result to dict
     def process_3d(self, name, data, processor):
-        self._3d_data[name] = processor(data)
+        self.add_data(name, processor(data))
 
     def add_2d_processing(self, name, func):
         self._2d_processing[name] = func
@@ -108,7 +165,8 @@ class VizApp:
         """
 
         :param name: str name to display
-        :param func: method  method to run
+        :param func: method  method to run, or its 'module:function' reference,
+                     which is only imported when the processing is used
         :param parameters: tuple - list of parameters
         :return: none
         """
@@ -117,7 +175,10 @@ class VizApp:
         if not isinstance(name, str):
             raise TypeError('add_3d_processing: name, {}, must be a string')
 
-        if not inspect.isfunction(func):
+        if isinstance(func, str):
+            if func.count(':') != 1:
+                raise ValueError('add_1d_processing: func, {}, must be a "module:function" reference'.format(func))
+        elif not inspect.isfunction(func):
             raise TypeError('add_3d_processing: func must be a method')
 
         if not isinstance(data_parameter, str):
@@ -150,10 +211,39 @@ class VizApp:
         # TODO: Fix the above description
 
         if name is not None:
-            return self._1d_processing[name]
+            return self._load_processing(self._1d_processing[name])
         else:
             return list(self._1d_processing.keys())
 
+    # ---------------------------------------------------------------
+    #
+    #  session
+    #
+    # ---------------------------------------------------------------
+
+    def save(self, path, compress=True, overwrite=False):
+        """
+        Save the datasets, processing and history to a session directory.
+
+        :param path: str - directory to write
+        :param compress: bool - compress the data chunks, uncompressed chunks
+                         are memory-mapped when loaded
+        :param overwrite: bool - replace an existing session directory
+        :return: none
+        """
+        save_session(self, path, compress=compress, overwrite=overwrite)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a session saved with save(). The data are read lazily, only the
+        parts that are looked at are loaded from disk.
+
+        :param path: str - session directory
+        :return: VizApp
+        """
+        return load_session(path, cls())
+
     # ---------------------------------------------------------------
     #
     #  data
@@ -169,12 +259,182 @@ class VizApp:
         :return:
         """
         logger.debug('Adding data {} {}'.format(name, data.shape))
+        self._register_data(name, data)
+
+    def _register_data(self, name, data, statistics=None, grid=None):
+        """
+        Put a dataset in its container. Anything kept about a previous
+        dataset of that name (statistics, pyramid, grid, shared memory) is
+        dropped and its version changes. Everything that adds or replaces a
+        dataset must go through here.
+
+        :param name: Name of the dataset, used as the key.
+        :param data: 1D, 2D or 3D array-like
+        :param statistics: statistics of 3D data, computed in the background
+                           from the data if not given
+        :param grid: Grid - spatial grid of the data, the pixel grid if not given
+        :return: none
+        """
+        containers = {3: self._3d_data, 2: self._2d_data, 1: self._1d_data}
+        if len(data.shape) not in containers:
+            raise ValueError('add_data: data must be 1D, 2D or 3D, got shape {}'.format(data.shape))
+
+        for container in containers.values():
+            container.pop(name, None)
+
+        # Replacing shared data releases its shared memory.
+        if name in self._shared:
+            self._shared.pop(name).release()
+
+        self._3d_statistics.pop(name, None)
+        self._3d_pyramids.pop(name, None)
+        self._grids.pop(name, None)
+
+        containers[len(data.shape)][name] = data
+        self._data_versions[name] = next(self._version_counter)
+
         if len(data.shape) == 3:
-            self._3d_data[name] = data
-        if len(data.shape) == 2:
-            self._2d_data[name] = data
-        if len(data.shape) == 1:
-            self._1d_data[name] = data
+            self._3d_statistics[name] = statistics if statistics is not None else SliceStatistics(data).start()
+        if grid is not None:
+            self._grids[name] = grid
+
+        self._invalidate_views(name)
+
+    def _views_of(self, name):
+        """
+        Names of the views whose data come from a dataset, directly or
+        through other views.
+        """
+        views = []
+        for container in (self._3d_data, self._2d_data, self._1d_data):
+            for view_name, data in container.items():
+                seen = set()
+                while isinstance(data, DatasetView) and data.parent not in seen:
+                    if data.parent == name:
+                        views.append(view_name)
+                        break
+                    seen.add(data.parent)
+                    data = self.get_data(data.parent)
+        return views
+
+    def _invalidate_views(self, name):
+        """
+        The data of a dataset were replaced or appended to, so the data of
+        its views changed too: drop their statistics and pyramids and change
+        their versions. Views that no longer fit the data are removed.
+        """
+        containers = {3: self._3d_data, 2: self._2d_data, 1: self._1d_data}
+
+        for view_name in self._views_of(name):
+            view = self.get_data(view_name)
+            try:
+                ndim = len(view.shape)
+            except (IndexError, KeyError):
+                ndim = None
+
+            if ndim not in containers:
+                logger.warning('Removing view {}, it does not fit the data of {} any more'.format(view_name, name))
+                self._drop_data(view_name)
+                continue
+
+            # The number of dimensions of the view follows its parent's.
+            if view_name not in containers[ndim]:
+                for container in containers.values():
+                    container.pop(view_name, None)
+                containers[ndim][view_name] = view
+
+            grid = self._grids.get(view_name)
+            if grid is not None and (ndim < 2 or grid.shape != tuple(view.shape[-2:])):
+                self._grids.pop(view_name)
+
+            # The statistics are computed again when they are asked for.
+            self._3d_statistics.pop(view_name, None)
+            self._3d_pyramids.pop(view_name, None)
+            self._data_versions[view_name] = next(self._version_counter)
+
+    def add_appendable_data(self, name, slice_shape, dtype=float):
+        """
+        Add an empty 3D dataset that grows as slices are appended to it with
+        append_data. Its median collapse over wavelengths is a running
+        estimate, approximate once a pixel has more than 5 values (see
+        AppendableCube).
+
+        :param name: Name of the dataset, used as the key.
+        :param slice_shape: tuple - (ny, nx) shape of each slice
+        :param dtype: numpy dtype of the data
+        :return: AppendableCube
+        """
+        logger.debug('Adding appendable data {} {}'.format(name, slice_shape))
+        cube = AppendableCube(slice_shape, dtype=dtype)
+
+        statistics = SliceStatistics(cube)
+        cube.observe(lambda cube, old_length, new_length: statistics.extend(new_length))
+
+        self._register_data(name, cube, statistics=statistics)
+
+        return cube
+
+    def append_data(self, name, slices):
+        """
+        Append one slice or a chunk of slices to an appendable 3D dataset.
+
+        :param name: Name of the dataset
+        :param slices: Numpy array of shape (ny, nx) or (n, ny, nx)
+        :return:
+        """
+        data = self._3d_data[name]
+        if not isinstance(data, AppendableCube):
+            raise TypeError('append_data: {} is not an appendable dataset'.format(name))
+
+        data.append(slices)
+        self._data_versions[name] = next(self._version_counter)
+        self._invalidate_views(name)
+
+    def add_view(self, name, parent, key=None, axes=None):
+        """
+        Add a dataset that is a view over another one, e.g. a spatial cutout
+        or a wavelength range. The data are not copied.
+
+        :param name: Name of the dataset, used as the key.
+        :param parent: str - name of the dataset to take the view of
+        :param key: tuple - ints and slices to apply to the parent
+        :param axes: tuple - permutation of the remaining axes, as np.transpose
+        :return: DatasetView
+        """
+        view = DatasetView(self, parent, key, axes)
+        logger.debug('Adding view {} of {}: {}'.format(name, parent, view.provenance))
+
+        self.add_data(name, view)
+
+        return view
+
+    def get_provenance(self, name):
+        """
+        Get how a view was derived from its parent.
+
+        :param name: str  key for lookup
+        :return: dict - parent, key and axes, or None if name is not a view
+        """
+        data = self.get_data(name)
+        if isinstance(data, DatasetView):
+            return data.provenance
+        return None
+
+    def materialize(self, name):
+        """
+        Replace a view by a contiguous copy of its data.
+
+        :param name: str  key for lookup
+        :return: numpy array
+        """
+        data = self.get_data(name)
+        if not isinstance(data, DatasetView):
+            return data
+
+        data = data.materialize()
+        self.add_data(name, data)
+
+        return data
 
     def get_data(self, name):
         """
@@ -200,3 +460,213 @@ class VizApp:
                 return self._1d_data[name]
         else:
             raise('get_data takes an int or string.')
+
+    def remove_data(self, name):
+        """
+        Remove a dataset, releasing its shared memory if it has any. A
+        dataset that has views can not be removed before its views.
+
+        :param name: str  key for lookup
+        :return: none
+        """
+        views = self._views_of(name)
+        if views:
+            raise ValueError('remove_data: {} has views {}, remove them first'.format(name, ', '.join(views)))
+
+        logger.debug('Removing data {}'.format(name))
+        self._drop_data(name)
+
+    def _drop_data(self, name):
+        for container in (self._3d_data, self._2d_data, self._1d_data):
+            container.pop(name, None)
+
+        self._3d_statistics.pop(name, None)
+        self._3d_pyramids.pop(name, None)
+        self._grids.pop(name, None)
+        self._data_versions.pop(name, None)
+
+        shared = self._shared.pop(name, None)
+        if shared is not None:
+            shared.release()
+
+    def share_data(self, name, kind='shm', directory=None):
+        """
+        Move a dataset into shared memory, so worker processes can use it
+        without a copy. The returned handle is small and picklable, pass it
+        to the workers and call its attach() method there.
+
+        The shared memory is released when the dataset is removed or
+        replaced, or at interpreter exit.
+
+        Appendable datasets and views can not be shared. Sharing the parent
+        of a view makes the view read from shared memory, without a copy.
+
+        :param name: str  key for lookup
+        :param kind: str - 'shm' for a named shared memory segment or
+                     'memmap' for a memory-mapped file
+        :param directory: str - directory of the file for 'memmap'
+        :return: SharedArrayHandle
+        """
+        if name in self._shared:
+            return self._shared[name].handle
+
+        data = self.get_data(name)
+        if data is None:
+            raise KeyError('share_data: no dataset {}'.format(name))
+
+        # These would be replaced by a fixed copy of their current data.
+        if isinstance(data, AppendableCube):
+            raise TypeError('share_data: {} is appendable, it can not be moved to shared memory'.format(name))
+        if isinstance(data, DatasetView):
+            raise TypeError('share_data: {} is a view, share its parent {} instead'.format(name, data.parent))
+
+        shared = SharedArray(data, kind=kind, directory=directory)
+        logger.debug('Sharing data {} as {}'.format(name, shared.handle))
+
+        # The statistics and grid do not change by moving the data, only
+        # what the statistics read.
+        previous, statistics = self._3d_statistics.get(name), None
+        if previous is not None:
+            statistics = SliceStatistics(shared.array)
+            if previous.done:
+                statistics.set_state(previous.get_state())
+            else:
+                statistics.start()
+
+        self._register_data(name, shared.array, statistics=statistics, grid=self._grids.get(name))
+        self._shared[name] = shared
+
+        return shared.handle
+
+    def get_handle(self, name):
+        """
+        Get the handle of a dataset that is in shared memory.
+
+        :param name: str  key for lookup
+        :return: SharedArrayHandle, or None if the dataset is not shared
+        """
+        shared = self._shared.get(name)
+        return shared.handle if shared is not None else None
+
+    def get_pyramid(self, name):
+        """
+        Get the multi-resolution, bricked representation of a 3D dataset used
+        for volume rendering. It is created on first use and cached.
+
+        :param name: str  key for lookup
+        :return: BrickPyramid
+        """
+        data = self._3d_data[name]
+
+        # Appendable data may have grown since the pyramid was made, and the
+        # pyramid must never outlive the data it was made from.
+        pyramid = self._3d_pyramids.get(name)
+        if pyramid is None or pyramid.data is not data or pyramid.shape != tuple(data.shape):
+            self._3d_pyramids[name] = BrickPyramid(data)
+        return self._3d_pyramids[name]
+
+    def get_data_version(self, name):
+        """
+        Get a number that changes every time a dataset is added or appended to.
+
+        :param name: str  key for lookup
+        :return: int
+        """
+        return self._data_versions.get(name)
+
+    def get_statistics(self, name):
+        """
+        Get the per-slice statistics of a 3D dataset. These are computed in
+        the background when the data is added, or for a view when they are
+        first asked for after its parent changed.
+
+        :param name: str  key for lookup
+        :return: SliceStatistics
+        """
+        if name not in self._3d_statistics:
+            self._3d_statistics[name] = SliceStatistics(self._3d_data[name]).start()
+
+        return self._3d_statistics[name]
+
+    # ---------------------------------------------------------------
+    #
+    #  grids
+    #
+    # ---------------------------------------------------------------
+
+    def set_grid(self, name, grid):
+        """
+        Set the spatial grid of a 2D or 3D dataset.
+
+        :param name: str  key for lookup
+        :param grid: Grid - spatial grid of the data
+        :return: none
+        """
+        data = self.get_data(name)
+        if data is None or len(data.shape) < 2:
+            raise ValueError('set_grid: {} is not a 2D or 3D dataset'.format(name))
+
+        if tuple(data.shape[-2:]) != grid.shape:
+            raise ValueError('set_grid: grid shape {} does not match the data shape {}'.format(
+                grid.shape, data.shape))
+
+        self._grids[name] = grid
+
+    def get_grid(self, name):
+        """
+        Get the spatial grid of a 2D or 3D dataset, by default its pixel grid.
+        The grid of a view is, by default, the part of its parent's grid that
+        it covers.
+
+        :param name: str  key for lookup
+        :return: Grid
+        """
+        if name in self._grids:
+            return self._grids[name]
+
+        data = self.get_data(name)
+        if isinstance(data, DatasetView):
+            return self._view_grid(name, data)
+        return Grid(data.shape[-2:])
+
+    def _view_grid(self, name, view):
+        provenance = view.provenance
+        key, axes = provenance['key'], provenance['axes']
+
+        # The view must keep the y and x axes of its parent, in that order, as its last two axes.
+        view_axes = [ii for ii, x in enumerate(key) if isinstance(x, slice)]
+        order = [view_axes[ii] for ii in axes] if axes is not None else view_axes
+        spatial = [len(key) - 2, len(key) - 1]
+        if order[-2:] != spatial:
+            raise ValueError('get_grid: view {} does not keep the spatial axes of {}, set its grid with set_grid'.format(
+                name, view.parent))
+
+        parent_grid = self.get_grid(view.parent)
+        parent_shape = self.get_data(view.parent).shape
+        (y0, _, dy), (x0, _, dx) = [key[axis].indices(parent_shape[axis]) for axis in spatial]
+
+        origin = parent_grid.pixel_to_world(y0, x0)
+        scale = (parent_grid.scale[0] * dy, parent_grid.scale[1] * dx)
+
+        return Grid(view.shape[-2:], origin=origin, scale=scale, rotation=parent_grid.rotation)
+
+    def get_aligned_data(self, name, target, index=None):
+        """
+        Get a 2D or 3D dataset resampled onto the spatial grid of another.
+        The resampling operator for each pair of grids is built once and
+        cached.
+
+        :param name: str  key of the data to resample
+        :param target: str  key of the dataset whose grid to resample onto
+        :param index: int - only resample this slice of a 3D dataset
+        :return: numpy array
+        """
+        data = self.get_data(name)
+        if index is not None:
+            data = data[index]
+
+        source_grid, target_grid = self.get_grid(name), self.get_grid(target)
+        if source_grid == target_grid:
+            return data
+
+        return self._resampling.get(source_grid, target_grid).apply(data)